@@ -1,36 +1,1284 @@
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
-from PIL import Image
-import random, math
+try:
+    import tkinter as tk
+    from tkinter import filedialog, ttk, messagebox
+    from PIL import ImageTk
+except ImportError:  # headless installs can still use the render command
+    tk = None
+from PIL import Image, GifImagePlugin
+import numpy as np
+import argparse
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import functools
+import glob
+import gzip
+import hashlib
+import importlib.util
+import json
+import math
+import multiprocessing
+from multiprocessing import shared_memory
 import time
 import os
+import platform
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+import weakref
+import zlib
+
+STYLE_NAMES = ["Normal", "Van Gogh", "Pixel Art", "Cyberpunk"]
+SPIKE_TYPES = ["spiral", "shooting", "orbit", "bounce"]
+
+SPIKE_FIELDS = {
+    'spiral': ('x', 'y', 'angle', 'radius', 'speed', 'color_shift', 'intensity', 'effect_radius'),
+    'shooting': ('x', 'y', 'move_x', 'move_y', 'speed', 'color_shift', 'intensity', 'effect_radius'),
+    'orbit': ('x', 'y', 'orbit_radius', 'orbit_angle', 'speed', 'color_shift', 'intensity', 'effect_radius'),
+    'bounce': ('x', 'y', 'move_x', 'move_y', 'speed', 'color_shift', 'intensity', 'effect_radius'),
+}
+
+
+class SpikeBatch:
+    # All spikes of one animation type, one contiguous row per field
+    __slots__ = ('type', 'fields', 'data')
+
+    def __init__(self, spike_type, columns):
+        self.type = spike_type
+        self.fields = {name: i for i, name in enumerate(SPIKE_FIELDS[spike_type])}
+        self.data = np.empty((len(self.fields), len(columns['x'])))
+        for name, i in self.fields.items():
+            self.data[i] = columns[name]
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __getitem__(self, name):
+        return self.data[self.fields[name]]
+
+    def __setitem__(self, name, values):
+        self.data[self.fields[name]] = values
+
+
+class SpikeView:
+    # Dict-style view of a single spike, for code that reads spike['x'] etc.
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.batch.type
+        return float(self.batch[key][self.index])
+
+    def __setitem__(self, key, value):
+        self.batch[key][self.index] = value
+
+
+class SpikeStore:
+    # Struct-of-arrays spike system: spikes are created and animated with
+    # batched math per type instead of one dict per spike.
+    def __init__(self, rng=None):
+        self.batches = {}
+        # Pass a seeded numpy Generator for reproducible spike layouts
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def __len__(self):
+        return sum(len(batch) for batch in self.batches.values())
+
+    def __iter__(self):
+        for batch in self.batches.values():
+            for i in range(len(batch)):
+                yield SpikeView(batch, i)
+
+    def __getitem__(self, index):
+        for batch in self.batches.values():
+            if index < len(batch):
+                return SpikeView(batch, index)
+            index -= len(batch)
+        raise IndexError("spike index out of range")
+
+    def clear(self):
+        self.batches = {}
+
+    def add(self, spike_type, columns):
+        if spike_type in self.batches:
+            old = self.batches[spike_type]
+            columns = {name: np.concatenate((old[name], columns[name])) for name in old.fields}
+        self.batches[spike_type] = SpikeBatch(spike_type, columns)
+
+    def column(self, name):
+        # One field for every spike, in iteration order
+        if not self.batches:
+            return np.empty(0)
+        return np.concatenate([batch[name] for batch in self.batches.values()])
+
+    def create_spikes(self, spike_type, count, w, h, intensity, radius):
+        creators = {
+            'spiral': self.create_spiral_spikes,
+            'shooting': self.create_shooting_spikes,
+            'orbit': self.create_orbiting_spikes,
+            'bounce': self.create_bouncing_spikes,
+        }
+        creators.get(spike_type, self.create_spiral_spikes)(count, w, h, intensity, radius)
+
+    def create_spiral_spikes(self, count, w, h, intensity, radius):
+        phase = (np.arange(count) / count) * 2 * np.pi
+        self.add('spiral', {
+            'x': np.full(count, w // 2, dtype=np.float64),
+            'y': np.full(count, h // 2, dtype=np.float64),
+            'angle': phase,
+            'radius': np.full(count, 20.0),
+            'speed': np.full(count, 0.5),
+            'color_shift': phase,
+            'intensity': np.full(count, intensity),
+            'effect_radius': np.full(count, radius),
+        })
+
+    def create_shooting_spikes(self, count, w, h, intensity, radius):
+        center_x, center_y = w // 2, h // 2
+        angle = self.rng.uniform(0, 2 * np.pi, count)
+        distance = self.rng.uniform(50, 150, count)
+        start_x = center_x + np.cos(angle) * distance
+        start_y = center_y + np.sin(angle) * distance
+
+        dx = center_x - start_x
+        dy = center_y - start_y
+        length = np.sqrt(dx*dx + dy*dy)
+        safe_length = np.where(length > 0, length, 1)
+
+        self.add('shooting', {
+            'x': start_x,
+            'y': start_y,
+            'move_x': np.where(length > 0, dx / safe_length, 0),
+            'move_y': np.where(length > 0, dy / safe_length, 0),
+            'speed': np.full(count, 1.0),
+            'color_shift': self.rng.uniform(0, 2 * np.pi, count),
+            'intensity': np.full(count, intensity * 1.2),
+            'effect_radius': np.full(count, radius * 0.6),
+        })
+
+    def create_orbiting_spikes(self, count, w, h, intensity, radius):
+        orbit_radius = 60 + np.arange(count) * 10.0
+        phase = (np.arange(count) / count) * 2 * np.pi
+        self.add('orbit', {
+            'x': w // 2 + orbit_radius,
+            'y': np.full(count, h // 2, dtype=np.float64),
+            'orbit_radius': orbit_radius,
+            'orbit_angle': phase,
+            'speed': np.full(count, 0.2),
+            'color_shift': phase,
+            'intensity': np.full(count, intensity),
+            'effect_radius': np.full(count, radius * 0.6),
+        })
+
+    def create_bouncing_spikes(self, count, w, h, intensity, radius):
+        angle = self.rng.uniform(0, 2 * np.pi, count)
+        self.add('bounce', {
+            # Like random.uniform, tolerate grids narrower than the 50px margins
+            'x': 50 + (w - 100) * self.rng.random(count),
+            'y': 50 + (h - 100) * self.rng.random(count),
+            'move_x': np.cos(angle),
+            'move_y': np.sin(angle),
+            'speed': np.full(count, 0.8),
+            'color_shift': self.rng.uniform(0, 2 * np.pi, count),
+            'intensity': np.full(count, intensity),
+            'effect_radius': np.full(count, radius * 0.5),
+        })
+
+    def rescale(self, sx, sy):
+        # Keep every spike at the same place on screen when the grid it lives
+        # on is resized by sx horizontally and sy vertically
+        scale = math.sqrt(sx * sy)
+        for batch in self.batches.values():
+            batch['x'] *= sx
+            batch['y'] *= sy
+            for name in ('radius', 'orbit_radius', 'effect_radius'):
+                if name in batch.fields:
+                    batch[name] *= scale
+
+    def update(self, w, h, t):
+        updaters = {
+            'spiral': self.update_spiral_spikes,
+            'shooting': self.update_shooting_spikes,
+            'orbit': self.update_orbiting_spikes,
+            'bounce': self.update_bouncing_spikes,
+        }
+        for spike_type, batch in self.batches.items():
+            updaters[spike_type](batch, w, h, t)
+
+    def update_spiral_spikes(self, batch, w, h, t):
+        batch['radius'] += batch['speed'] * 0.8
+        batch['angle'] += 0.05
+        batch['x'] = w // 2 + np.cos(batch['angle']) * batch['radius']
+        batch['y'] = h // 2 + np.sin(batch['angle']) * batch['radius']
+        batch['color_shift'] += 0.02
+
+    def update_shooting_spikes(self, batch, w, h, t):
+        batch['x'] += batch['move_x'] * batch['speed'] * 2
+        batch['y'] += batch['move_y'] * batch['speed'] * 2
+        batch['color_shift'] += 0.04
+
+        x, y = batch['x'], batch['y']
+        gone = (x < -100) | (x > w + 100) | (y < -100) | (y > h + 100)
+        count = int(gone.sum())
+        if count:
+            angle = self.rng.uniform(0, 2 * np.pi, count)
+            distance = self.rng.uniform(50, 150, count)
+            x[gone] = w // 2 + np.cos(angle) * distance
+            y[gone] = h // 2 + np.sin(angle) * distance
+
+    def update_orbiting_spikes(self, batch, w, h, t):
+        batch['orbit_angle'] += batch['speed']
+        batch['x'] = w // 2 + np.cos(batch['orbit_angle']) * batch['orbit_radius']
+        batch['y'] = h // 2 + np.sin(batch['orbit_angle']) * batch['orbit_radius']
+        batch['color_shift'] += 0.015
+
+    def update_bouncing_spikes(self, batch, w, h, t):
+        batch['x'] += batch['move_x'] * batch['speed']
+        batch['y'] += batch['move_y'] * batch['speed']
+        batch['color_shift'] += 0.02
+
+        x, y = batch['x'], batch['y']
+        move_x, move_y = batch['move_x'], batch['move_y']
+        move_x[(x <= 0) | (x >= w)] *= -1
+        move_y[(y <= 0) | (y >= h)] *= -1
+
+
+class SpikeFrame:
+    # One tick's spike columns, as the renderers read them. Colour shift terms
+    # only depend on the spike, so they are evaluated once per tick.
+    def __init__(self, spikes):
+        self.x = spikes.column('x')
+        self.y = spikes.column('y')
+        self.radius = spikes.column('effect_radius')
+        self.intensity = spikes.column('intensity')
+
+        color_shift = spikes.column('color_shift')
+        self.r_shift = np.sin(color_shift) * 60
+        self.g_shift = np.cos(color_shift) * 60
+        self.b_shift = np.sin(color_shift + np.pi/2) * 60
+
+    def __len__(self):
+        return len(self.x)
+
+
+class SpikeField:
+    # Accumulates every spike's colour offset into a (3, h, w) buffer, one value
+    # per grid cell. The (1 - distance/effect_radius) falloff around a spike
+    # only depends on its radius, so it is precomputed once as a stamp and each
+    # spike adds a scaled copy at its position: the cost is spikes x stamp area
+    # rather than pixels x spikes.
+    def __init__(self, max_stamps=32):
+        self.max_stamps = max_stamps
+        self.stamps = collections.OrderedDict()
+        self.buffer = None
+
+    def stamp(self, radius):
+        # Falloff on whole-cell offsets from the centre, zero from the radius out
+        stamp = self.stamps.get(radius)
+        if stamp is not None:
+            self.stamps.move_to_end(radius)
+            return stamp
+
+        half = max(0, math.ceil(radius) - 1)
+        dy, dx = np.mgrid[-half:half + 1, -half:half + 1]
+        distance = np.sqrt(dx * dx + dy * dy)
+        stamp = np.where(distance < radius, 1 - distance / max(radius, 1e-9), 0.0)
+        self.stamps[radius] = stamp
+        if len(self.stamps) > self.max_stamps:
+            self.stamps.popitem(last=False)
+        return stamp
+
+    def accumulate(self, spikes, w, row0, row1, out=None):
+        # Field for grid rows row0..row1-1 only, written into out (3, rows, w)
+        # if given; spikes that can't reach those rows are culled before any
+        # stamping
+        if out is None:
+            if self.buffer is None or self.buffer.shape != (3, row1 - row0, w):
+                self.buffer = np.empty((3, row1 - row0, w))
+            out = self.buffer
+        field = out
+        field.fill(0.0)
+
+        centre_x = np.rint(spikes.x).astype(np.int64)
+        centre_y = np.rint(spikes.y).astype(np.int64)
+        reach = np.maximum(np.ceil(spikes.radius) - 1, 0).astype(np.int64)
+        ids = np.flatnonzero((centre_y + reach >= row0) & (centre_y - reach < row1)
+                             & (centre_x + reach >= 0) & (centre_x - reach < w))
+
+        # Per-spike colour terms, computed once per spike rather than per pixel
+        weights = (np.stack((spikes.r_shift, spikes.g_shift, spikes.b_shift))[:, ids]
+                   * spikes.intensity[ids])
+
+        for i, (cx, cy, radius) in enumerate(zip(centre_x[ids].tolist(), centre_y[ids].tolist(),
+                                                 spikes.radius[ids].tolist())):
+            stamp = self.stamp(radius)
+            half = stamp.shape[0] // 2
+            # Clip the stamp to the part that lands in the rows being built
+            x0, x1 = max(cx - half, 0), min(cx + half + 1, w)
+            y0, y1 = max(cy - half, row0), min(cy + half + 1, row1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            part = stamp[y0 - cy + half:y1 - cy + half, x0 - cx + half:x1 - cx + half]
+            field[:, y0 - row0:y1 - row0, x0:x1] += part * weights[:, i, None, None]
+        return field
+
+
+# ==================== STYLE PLUGINS ====================
+
+# Style kernels by name. kernel(engine, rgb, x, y, t) restyles a chunk of pixels
+# in place: rgb is a (3, n) float array of whole numbers in 0-255 and x, y are
+# the pixels' grid positions. Frames are fed through in chunks, so a kernel
+# must work element-wise and leave whole numbers in 0-255 behind for the next
+# style in the chain.
+STYLE_KERNELS = {}
+LOADED_PLUGINS = []
+
+
+def register_style(name, kernel):
+    if "+" in name:
+        raise ValueError(f"Style names can't contain '+': {name!r}")
+    STYLE_KERNELS[name] = kernel
+    if name not in STYLE_NAMES:
+        STYLE_NAMES.append(name)
+
+
+def style_chain(style):
+    # "Pixel Art + Cyberpunk" -> ("Pixel Art", "Cyberpunk"); Normal is a no-op
+    names = [name.strip() for name in style.split("+")]
+    unknown = [name for name in names if name != "Normal" and name not in STYLE_KERNELS]
+    if unknown:
+        raise ValueError(f"Unknown style: {', '.join(unknown)}")
+    return tuple(name for name in names if name != "Normal")
+
+
+def load_style_plugins(paths):
+    # A plugin is a Python file defining STYLES = {name: kernel, ...}
+    for path in paths:
+        LOADED_PLUGINS.append(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(f"spike_style_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for style, kernel in getattr(module, "STYLES", {}).items():
+            register_style(style, kernel)
+
+
+# Built-in kernels for the Van Gogh, Pixel Art and Cyberpunk styles. Results
+# are truncated exactly like int(). Pixel Art quantizes through a 256-entry
+# table, which beats floor division; the other colour and position terms are
+# cheaper to compute directly than to gather from tables.
+PIXEL_ART_LEVELS = (np.arange(256, dtype=np.float64) // 32) * 32
+
+
+def van_gogh_kernel(engine, rgb, x, y, t):
+    swirl = np.sin(x * 0.05 + y * 0.03 + t * 2) * 80
+    for channel, weight in zip(rgb, (0.8, 0.6, 0.4)):
+        channel += swirl * weight
+        np.remainder(channel, 256, out=channel)
+        np.trunc(channel, out=channel)
+
+
+def pixel_art_kernel(engine, rgb, x, y, t):
+    for channel in rgb:
+        np.take(PIXEL_ART_LEVELS, channel.astype(np.intp), out=channel, mode='clip')
+
+
+def cyberpunk_kernel(engine, rgb, x, y, t):
+    pulse = (np.sin(t * 4 + x * 0.02) + 1) * 0.5
+    mixes = ((0.2, 255, 0.8), (0.3, 100, 0.5), (0.1, 255, 0.9))
+    for channel, (mix, scale, weight) in zip(rgb, mixes):
+        channel *= mix
+        channel += scale * pulse * weight
+        np.trunc(channel, out=channel)
+
+
+register_style("Van Gogh", van_gogh_kernel)
+register_style("Pixel Art", pixel_art_kernel)
+register_style("Cyberpunk", cyberpunk_kernel)
+
+
+class FrameEngine:
+    # Vectorized frame engine: the resized image lives in an (H, W, 3) array and
+    # every pixel's position/velocity in flat arrays, so styles, spike effects and
+    # movement are computed for the whole frame in one batched pass per tick.
+    STYLE_CHUNK = 1 << 14  # pixels per pass through sampling, styles and spike effects
+    workers = 1  # processes rendering each frame
+
+    def __init__(self, image, pixel_size, rng=None):
+        self.pixel_size = pixel_size
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.set_source(image)
+        self.pos_x = self.origin_x.copy()
+        self.pos_y = self.origin_y.copy()
+        self.vel_x = self.rng.uniform(-1, 1, self.origin_x.size)
+        self.vel_y = self.rng.uniform(-1, 1, self.origin_x.size)
+        # Optional FrameProfiler timing the stages of render()
+        self.profiler = None
+        self.spike_field = SpikeField()
+
+    def set_source(self, image):
+        self.src = np.asarray(image, dtype=np.uint8)
+        self.h, self.w = self.src.shape[:2]
+
+        # Pixel i starts at column i % w, row i // w
+        ys, xs = np.mgrid[0:self.h, 0:self.w]
+        self.origin_x = xs.ravel().astype(np.float64)
+        self.origin_y = ys.ravel().astype(np.float64)
+
+    def __len__(self):
+        return self.origin_x.size
+
+    def resize(self, image, pixel_size):
+        # Switch to a differently sized grid of the same image mid-animation.
+        # Each new pixel takes the velocity of the old pixel nearest to it and
+        # its drift from its origin, scaled to the new grid.
+        old_w, old_h = self.w, self.h
+        drift_x = self.pos_x - self.origin_x
+        drift_y = self.pos_y - self.origin_y
+        self.pixel_size = pixel_size
+        self.set_source(image)
+
+        nearest = ((self.origin_y * old_h // self.h) * old_w
+                   + self.origin_x * old_w // self.w).astype(np.int64)
+        self.pos_x = (self.origin_x + drift_x[nearest] * (self.w / old_w)) % self.w
+        self.pos_y = (self.origin_y + drift_y[nearest] * (self.h / old_h)) % self.h
+        self.vel_x = self.vel_x[nearest]
+        self.vel_y = self.vel_y[nearest]
+
+    def reset_positions(self):
+        self.pos_x = self.origin_x.copy()
+        self.pos_y = self.origin_y.copy()
+
+    def close(self):
+        pass
+
+    def source_colors(self, x, y):
+        xi = x.astype(np.int64) % self.w
+        yi = y.astype(np.int64) % self.h
+        return self.src[yi, xi].astype(np.float64)
+
+    def spike_effect_field(self, spikes):
+        # The frame's spike field over the whole grid, or None without spikes
+        if spikes is None or not len(spikes):
+            return None
+        return self.spike_field.accumulate(spikes, self.w, 0, self.h)
+
+    def apply_spike_effects(self, rgb, x, y, field):
+        # In place on a (3, n) chunk: every pixel picks up the field of the
+        # cell it currently sits in
+        if field is None or not x.size:
+            return
+        cell = (y.astype(np.int64) % self.h) * self.w + x.astype(np.int64) % self.w
+        for channel, plane in zip(rgb, field.reshape(3, -1)):
+            channel += plane[cell]
+            np.clip(channel, 0, 255, out=channel)
+            np.trunc(channel, out=channel)
+
+    def compose(self, colors, x, y, background=(0, 0, 16)):
+        # Composite a frame into an off-screen RGB buffer at canvas resolution,
+        # drawing each pixel as a pixel_size square like the canvas rectangles
+        ps = self.pixel_size
+        frame = np.empty((self.h * ps, self.w * ps, 3), dtype=np.uint8)
+        frame[:] = background
+        xs = np.minimum((x * ps).astype(np.int64), (self.w - 1) * ps)
+        ys = np.minimum((y * ps).astype(np.int64), (self.h - 1) * ps)
+        for oy in range(ps):
+            for ox in range(ps):
+                frame[ys + oy, xs + ox] = colors
+        return frame
+
+    def source_frame(self):
+        # The untouched image with every pixel at its origin
+        ps = self.pixel_size
+        return np.repeat(np.repeat(self.src, ps, axis=0), ps, axis=1)
+
+    def stage(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name)
+
+    def render(self, t, style, spikes):
+        # Colors for every pixel at its current position, then advance all
+        # positions. Returns the colors with the positions they were drawn at.
+        x, y = self.pos_x, self.pos_y
+        colors = np.empty((len(self), 3), dtype=np.uint8)
+        with self.stage("spike_effects"):
+            field = self.spike_effect_field(spikes)
+        self.shade(x, y, t, style, field, colors)
+
+        with self.stage("move"):
+            self.pos_x = (x + self.vel_x * 0.1) % self.w
+            self.pos_y = (y + self.vel_y * 0.1) % self.h
+        if self.profiler is not None:
+            self.profiler.count(pixels=len(self))
+        return colors, x, y
+
+    def shade(self, x, y, t, style, field, out):
+        # Colours of the pixels at positions x, y, written into out (n, 3),
+        # with the frame's spike field (3, h, w) or None
+        kernels = [STYLE_KERNELS[name] for name in style_chain(style)]
+
+        # Sampling, the whole style chain and the spike field run one chunk at
+        # a time through one scratch buffer and are stored straight into out,
+        # so no stage makes full-frame intermediates
+        scratch = np.empty((3, min(x.size, self.STYLE_CHUNK)))
+        for start in range(0, x.size, self.STYLE_CHUNK):
+            part = slice(start, start + self.STYLE_CHUNK)
+            xs, ys = x[part], y[part]
+            rgb = scratch[:, :xs.size]
+            with self.stage("sample"):
+                rgb[...] = self.source_colors(xs, ys).T
+            with self.stage("style"):
+                for kernel in kernels:
+                    kernel(self, rgb, xs, ys, t)
+            with self.stage("spike_effects"):
+                self.apply_spike_effects(rgb, xs, ys, field)
+                out[part] = rgb.T
+
+
+def make_engine(image, pixel_size, rng=None, cores=1):
+    if cores > 1:
+        return TileFrameEngine(image, pixel_size, rng, workers=cores)
+    return FrameEngine(image, pixel_size, rng)
+
+
+def release_segments(segments, unlink=False):
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass  # a view is still alive; the mapping goes away with the process
+        if unlink:
+            segment.unlink()
+
+
+class TileFrameEngine(FrameEngine):
+    # FrameEngine that renders each frame as horizontal tiles of pixel rows on a
+    # persistent process pool. The source grid, positions, velocities, spike
+    # field and output colours live in shared memory: workers read them and
+    # write in place, so a task only carries tile bounds and, for the field, the
+    # frame's spikes. Each frame first builds the spike field in bands of grid
+    # rows, then shades the pixel tiles against the whole field; pixels drift
+    # and wrap across the grid, so a tile's pixels can't be relied on to stay
+    # within its own rows. Positions are double-buffered, read from one half and
+    # written to the other, so tiles never see each other's half-moved pixels.
+    def __init__(self, image, pixel_size, rng=None, workers=None, tiles_per_worker=2):
+        self.workers = workers or available_cores()
+        self.tiles_per_worker = tiles_per_worker
+        self.segments = {}
+        super().__init__(image, pixel_size, rng)
+        self.share()
+        # Spawned, not forked: the app forks from a process running Tk and threads
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=load_style_plugins, initargs=(list(LOADED_PLUGINS),))
+        self.finalizer = weakref.finalize(self, TileFrameEngine.shutdown, self.pool, self.segments)
+        # Start every worker and map the shared buffers in it now, while the
+        # engine is being set up, rather than during the first frames
+        for future in [self.pool.submit(attach_tile, self.layout) for _ in range(self.workers)]:
+            future.result()
+
+    @staticmethod
+    def shutdown(pool, segments):
+        pool.shutdown()
+        release_segments(segments.values(), unlink=True)
+        segments.clear()
+
+    def close(self):
+        self.finalizer()
+
+    def share(self):
+        # Copy the grid state into shared memory, reusing the segments while
+        # the grid keeps its size. Called again whenever a FrameEngine method
+        # has replaced the state arrays.
+        state = {
+            "src": self.src,
+            "pos": np.stack((np.stack((self.pos_x, self.pos_y)),) * 2),
+            "vel": np.stack((self.vel_x, self.vel_y)),
+            "colors": np.zeros((len(self), 3), dtype=np.uint8),
+            "field": np.zeros((3, self.h, self.w)),
+        }
+        views, stale = {}, []
+        for name, array in state.items():
+            segment = self.segments.get(name)
+            if segment is None or self.layout_shape(name) != array.shape:
+                if segment is not None:
+                    stale.append(segment)
+                segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                self.segments[name] = segment
+            view = np.ndarray(array.shape, array.dtype, buffer=segment.buf)
+            view[...] = array
+            views[name] = view
+
+        self.src = views["src"]
+        self.positions = views["pos"]
+        self.front = 0
+        self.pos_x, self.pos_y = self.positions[0]
+        self.vel_x, self.vel_y = views["vel"]
+        self.colors = views["colors"]
+        self.field = views["field"]
+        self.layout = {
+            "segments": {name: (segment.name, views[name].shape, views[name].dtype.str)
+                         for name, segment in self.segments.items()},
+            "pixel_size": self.pixel_size,
+        }
+        release_segments(stale, unlink=True)
+
+        # Field bands are runs of grid rows; tile boundaries fall on the same
+        # whole rows of the (row-major) pixel ids
+        count = min(self.h, self.workers * self.tiles_per_worker)
+        rows = np.linspace(0, self.h, count + 1).astype(np.int64)
+        self.bands = list(zip(rows[:-1].tolist(), rows[1:].tolist()))
+        self.tiles = [(row0 * self.w, row1 * self.w) for row0, row1 in self.bands]
+
+    def layout_shape(self, name):
+        layout = getattr(self, "layout", None)
+        return tuple(layout["segments"][name][1]) if layout else None
+
+    def reset_positions(self):
+        super().reset_positions()
+        self.share()
+
+    def resize(self, image, pixel_size):
+        super().resize(image, pixel_size)
+        self.share()
+
+    def render(self, t, style, spikes):
+        style_chain(style)  # fail here rather than in every worker
+        start = time.perf_counter()
+        front = self.front
+        records = []
+        spiked = spikes is not None and len(spikes) > 0
+        if spiked:
+            futures = [self.pool.submit(stamp_band, self.layout, row0, row1, spikes)
+                       for row0, row1 in self.bands]
+            records += [future.result() for future in futures]
+        futures = [self.pool.submit(render_tile, self.layout, first, last, front, t, style,
+                                    spiked)
+                   for first, last in self.tiles]
+        records += [future.result() for future in futures]
+
+        if self.profiler is not None:
+            # Worker stage times add up to CPU time across the pool; scale them
+            # so the stages share out the wall time the frame actually took
+            wall = time.perf_counter() - start
+            busy = sum(record[stage] for record in records for stage in FrameProfiler.STAGES)
+            scale = wall / busy if busy else 0.0
+            for stage in FrameProfiler.STAGES:
+                self.profiler.current[stage] += scale * sum(record[stage] for record in records)
+            self.profiler.count(pixels=len(self))
+
+        x, y = self.positions[front]
+        colors, x, y = self.colors.copy(), x.copy(), y.copy()
+        self.front = 1 - front
+        self.pos_x, self.pos_y = self.positions[self.front]
+        return colors, x, y
+
+
+# Per worker process: the engine over the shared buffers of the current layout
+TILE_STATE = {}
+
+
+def tile_engine(layout):
+    key = tuple(name for name, shape, dtype in layout["segments"].values())
+    if TILE_STATE.get("key") != key:
+        segments = TILE_STATE.get("segments", ())
+        TILE_STATE.clear()
+        release_segments(segments)
+
+        segments = {name: shared_memory.SharedMemory(name=shm_name)
+                    for name, (shm_name, shape, dtype) in layout["segments"].items()}
+        views = {name: np.ndarray(shape, dtype, buffer=segments[name].buf)
+                 for name, (shm_name, shape, dtype) in layout["segments"].items()}
+
+        # A FrameEngine over the shared arrays; only what shade() needs is set
+        engine = FrameEngine.__new__(FrameEngine)
+        engine.pixel_size = layout["pixel_size"]
+        engine.src = views["src"]
+        engine.h, engine.w = engine.src.shape[:2]
+        engine.positions, engine.colors = views["pos"], views["colors"]
+        engine.vel_x, engine.vel_y = views["vel"]
+        engine.field = views["field"]
+        engine.spike_field = SpikeField()
+        engine.profiler = FrameProfiler(max_frames=1)
+        TILE_STATE.update(key=key, segments=list(segments.values()), engine=engine)
+    return TILE_STATE["engine"]
+
+
+def attach_tile(layout):
+    tile_engine(layout)
+
+
+def stamp_band(layout, row0, row1, spikes):
+    # Build grid rows row0..row1-1 of the frame's spike field in shared memory
+    engine = tile_engine(layout)
+    engine.profiler.begin_frame()
+    with engine.stage("spike_effects"):
+        engine.spike_field.accumulate(spikes, engine.w, row0, row1,
+                                      out=engine.field[:, row0:row1])
+    return engine.profiler.take()
+
+
+def render_tile(layout, first, last, front, t, style, spiked):
+    # Shade and move pixels first..last-1, reading positions from one half of
+    # the double buffer and writing the moved ones to the other. The spike
+    # field has already been built for the frame if it has any spikes.
+    engine = tile_engine(layout)
+    engine.profiler.begin_frame()
+    x, y = engine.positions[front, :, first:last]
+    field = engine.field if spiked else None
+    engine.shade(x, y, t, style, field, engine.colors[first:last])
+    with engine.stage("move"):
+        moved = engine.positions[1 - front, :, first:last]
+        np.remainder(x + engine.vel_x[first:last] * 0.1, engine.w, out=moved[0])
+        np.remainder(y + engine.vel_y[first:last] * 0.1, engine.h, out=moved[1])
+    return engine.profiler.take()
+
+
+def pack_colors(colors):
+    # (N, 3) uint8 -> one 0xRRGGBB int per pixel, cheap to compare between frames
+    colors = colors.astype(np.int32)
+    return (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+
+def dirty_rectangles(previous, frame, tile=32):
+    # Canvas rectangles (x0, y0, x1, y1) covering every tile that differs between
+    # two frames: one span of dirty tiles per tile row, merged with the rows below
+    # while the span stays the same
+    changed = (previous != frame).any(axis=2)
+    h, w = changed.shape
+    rows, cols = -(-h // tile), -(-w // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+    padded[:h, :w] = changed
+    tiles = padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+    rects = []
+    for row in np.flatnonzero(tiles.any(axis=1)).tolist():
+        dirty_cols = np.flatnonzero(tiles[row])
+        x0, x1 = int(dirty_cols[0]) * tile, min((int(dirty_cols[-1]) + 1) * tile, w)
+        y0, y1 = row * tile, min((row + 1) * tile, h)
+        if rects and rects[-1][0] == x0 and rects[-1][2] == x1 and rects[-1][3] == y0:
+            rects[-1] = (x0, rects[-1][1], x1, y1)
+        else:
+            rects.append((x0, y0, x1, y1))
+    return rects
+
+
+def fit_size(canvas_w, canvas_h):
+    # Pixel size and grid size for a canvas of the given size
+    pixel_size = max(2, min(8, canvas_w // 150))
+    return pixel_size, (canvas_w // pixel_size, canvas_h // pixel_size)
+
+
+def fit_image(image, canvas_w, canvas_h):
+    # Pixel size and resized source for a canvas of the given size
+    pixel_size, size = fit_size(canvas_w, canvas_h)
+    return pixel_size, image.resize(size)
+
+
+def load_grid(path, size):
+    # Decode an image file straight down to a grid of the given size. JPEGs are
+    # decoded at a reduced scale by draft(); other formats are box-reduced by
+    # the largest whole factor before the final resize. The full-size image is
+    # closed as soon as the grid exists.
+    with Image.open(path) as image:
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image.resize(size)
+
+
+class GridLoader:
+    # Loads image files as pixel grids for a canvas, keeping the most recent
+    # ones so reopening an image or going back to a window size is instant.
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.cache = collections.OrderedDict()
+
+    def load(self, path, canvas_w, canvas_h):
+        pixel_size, size = fit_size(canvas_w, canvas_h)
+        path = os.path.abspath(path)
+        # A changed file gets a new mtime and so misses the cache
+        key = (path, os.stat(path).st_mtime_ns, (canvas_w, canvas_h), pixel_size)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return pixel_size, self.cache[key]
+
+        grid = load_grid(path, size)
+        self.cache[key] = grid
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return pixel_size, grid
+
+
+class OfflineRenderer:
+    # Drives the same style and spike logic as the Tk animator without a display,
+    # producing one composited frame at a time.
+    def __init__(self, image, style="Normal", spike_type=None, spike_count=6,
+                 canvas_size=(800, 600), intensity=0.5, radius=50, fps=30, seed=None, cores=1):
+        # One generator drives pixel velocities and spikes, so a seed fixes the output
+        rng = np.random.default_rng(seed)
+        pixel_size, resized = fit_image(image, *canvas_size)
+        self.engine = make_engine(resized, pixel_size, rng, cores)
+        self.style = style
+        self.fps = fps
+
+        self.spikes = SpikeStore(rng)
+        if spike_type:
+            self.spikes.create_spikes(spike_type, spike_count, self.engine.w, self.engine.h,
+                                      intensity, radius)
+
+    def frames(self, count, profiler=None):
+        self.engine.profiler = profiler
+        stage = self.engine.stage
+        for n in range(count):
+            if profiler is not None:
+                profiler.begin_frame()
+            t = n / self.fps
+            with stage("spikes"):
+                self.spikes.update(self.engine.w, self.engine.h, t)
+                snapshot = SpikeFrame(self.spikes)
+            colors, xs, ys = self.engine.render(t, self.style, snapshot)
+            with stage("compose"):
+                frame = Image.fromarray(self.engine.compose(colors, xs, ys))
+            if profiler is not None:
+                profiler.end_frame()
+            yield frame
+
+    def close(self):
+        self.engine.close()
+
+
+# ==================== SESSION RECORDING ====================
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SessionRecorder:
+    # Logs everything that decides what an animation session draws, as gzipped
+    # JSON lines: a header with the seed, image and canvas size, then timestamped
+    # events in the order they took effect. With the seed fixing every random
+    # draw and each frame's animation time and physics steps logged, replaying
+    # the events reproduces the session frame for frame.
+    VERSION = 1
+
+    def __init__(self, path, seed, image_path, canvas_size):
+        self.path = path
+        self.start = time.time()
+        self.file = gzip.open(path, "wt")
+        self.write({"version": self.VERSION, "seed": seed, "image": os.path.abspath(image_path),
+                    "image_sha256": file_digest(image_path), "canvas": list(canvas_size)})
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def event(self, kind, **fields):
+        self.write({"t": round(time.time() - self.start, 4), "type": kind, **fields})
+
+    def frame(self, t, steps):
+        self.event("frame", time=t, steps=steps)
+
+    def close(self):
+        self.file.close()
+
+
+def read_session(path):
+    with gzip.open(path, "rt") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != SessionRecorder.VERSION:
+            raise ValueError(f"{path}: unsupported session version {header.get('version')}")
+        return header, [json.loads(line) for line in f]
+
+
+class SessionPlayer:
+    # Re-drives a recorded session without a display, as fast as frames can be
+    # computed. The image is re-read from its recorded path unless another copy
+    # is given, and must match the recorded hash.
+    def __init__(self, path, image_path=None, cores=1):
+        self.header, self.events = read_session(path)
+        image_path = image_path or self.header["image"]
+        if file_digest(image_path) != self.header["image_sha256"]:
+            raise ValueError(f"{image_path} is not the image this session was recorded with")
+
+        self.image_path = image_path
+        self.canvas_size = tuple(self.header["canvas"])
+        pixel_size, size = fit_size(*self.canvas_size)
+        # Same generator, same draw order as the recorded session
+        rng = np.random.default_rng(self.header["seed"])
+        self.engine = make_engine(load_grid(image_path, size), pixel_size, rng, cores)
+        self.spikes = SpikeStore(rng)
+        self.style = "Normal"
+        self.frame_count = sum(event["type"] == "frame" for event in self.events)
+
+    def apply(self, event):
+        kind = event["type"]
+        engine = self.engine
+        if kind == "params":
+            self.style = event["style"]
+        elif kind == "spikes":
+            self.spikes.clear()
+            self.spikes.create_spikes(event["spike_type"], event["count"], engine.w, engine.h,
+                                      event["intensity"], event["radius"])
+        elif kind == "clear":
+            self.spikes.clear()
+        elif kind == "resize":
+            old_w, old_h = engine.w, engine.h
+            self.canvas_size = tuple(event["canvas"])
+            pixel_size, size = fit_size(*self.canvas_size)
+            engine.resize(load_grid(self.image_path, size), pixel_size)
+            self.spikes.rescale(engine.w / old_w, engine.h / old_h)
+
+    def frames(self, profiler=None):
+        # Yields (colors, x, y) for every recorded frame
+        engine = self.engine
+        engine.profiler = profiler
+        for event in self.events:
+            if event["type"] != "frame":
+                self.apply(event)
+                continue
+            if profiler is not None:
+                profiler.begin_frame()
+            t = event["time"]
+            with engine.stage("spikes"):
+                for _ in range(event["steps"]):
+                    self.spikes.update(engine.w, engine.h, t)
+                snapshot = SpikeFrame(self.spikes)
+            yield engine.render(t, self.style, snapshot)
+
+    def close(self):
+        self.engine.close()
+
+
+class GifStreamWriter:
+    # Appends frames to a looping GIF as they arrive; Image.save(save_all=True)
+    # would keep every frame in memory until the end.
+    def __init__(self, path, fps):
+        self.fp = open(path, "wb")
+        self.duration = round(1000 / fps)
+        self.started = False
+
+    def write(self, image):
+        frame = image.convert("P", palette=Image.Palette.ADAPTIVE)
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": 0})
+            self.fp.write(b"".join(header))
+            self.started = True
+        for chunk in GifImagePlugin.getdata(frame, duration=self.duration,
+                                            include_color_table=True):
+            self.fp.write(chunk)
+
+    def close(self):
+        self.fp.write(b";")
+        self.fp.close()
+
+
+class FfmpegWriter:
+    # Pipes raw RGB frames into ffmpeg for MP4 output
+    def __init__(self, path, fps):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("MP4 output needs ffmpeg on PATH")
+        self.path = path
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.process = None
+
+    def write(self, image):
+        if self.process is None:
+            w, h = image.size
+            self.process = subprocess.Popen([
+                self.ffmpeg, "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-r", str(self.fps),
+                "-i", "-",
+                # yuv420p needs even dimensions
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p", self.path,
+            ], stdin=subprocess.PIPE)
+        self.process.stdin.write(image.tobytes())
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError("ffmpeg failed to encode the video")
+
+
+class PngSequenceWriter:
+    # frame_%04d.png style patterns are used as-is, otherwise out.png
+    # becomes out_0000.png, out_0001.png, ...
+    def __init__(self, path):
+        if "%" not in path:
+            stem, ext = os.path.splitext(path)
+            path = f"{stem}_%04d{ext}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.pattern = path
+        self.index = 0
+
+    def write(self, image):
+        image.save(self.pattern % self.index)
+        self.index += 1
+
+    def close(self):
+        pass
+
+
+def open_frame_writer(path, fps):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".gif":
+        return GifStreamWriter(path, fps)
+    if ext == ".mp4":
+        return FfmpegWriter(path, fps)
+    if ext == ".png":
+        return PngSequenceWriter(path)
+    raise ValueError(f"Unsupported output format: {path} (use .gif, .mp4 or .png)")
+
+
+class FrameProfiler:
+    # Records per-stage timings, pixel counts and Tk calls for each frame. Only
+    # the most recent max_frames are kept so long sessions stay bounded.
+    STAGES = ("spikes", "sample", "style", "spike_effects", "move", "compose", "canvas")
+
+    def __init__(self, max_frames=18000):
+        self.frames = collections.deque(maxlen=max_frames)
+        # The frame being recorded is per thread, so a worker can compute one
+        # frame while the Tk thread finishes presenting another
+        self.local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self.local, "current", None)
+
+    @current.setter
+    def current(self, record):
+        self.local.current = record
+
+    def begin_frame(self):
+        self.current = dict.fromkeys(self.STAGES, 0.0)
+        self.current.update(pixels=0, drawn=0, tk_calls=0, _start=time.perf_counter())
+
+    def take(self):
+        # Detach the frame being recorded so another thread can resume() it
+        record, self.current = self.current, None
+        return record
+
+    def resume(self, record):
+        self.current = record
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] += time.perf_counter() - start
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self.current[key] += value
+
+    def end_frame(self):
+        record = self.take()
+        record["frame"] = time.perf_counter() - record.pop("_start")
+        self.frames.append(record)
+
+    def percentiles(self, key="frame", qs=(50, 95, 99)):
+        values = np.array([frame[key] for frame in self.frames])
+        if not values.size:
+            return dict.fromkeys(qs, 0.0)
+        return dict(zip(qs, np.percentile(values, qs).tolist()))
+
+    def means(self, keys):
+        return {key: sum(frame[key] for frame in self.frames) / max(1, len(self.frames))
+                for key in keys}
+
+    def summary(self):
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "frames": len(self.frames),
+            "frame_ms": {f"p{q}": ms(v) for q, v in self.percentiles().items()},
+            "stage_ms": {k: ms(v) for k, v in self.means(self.STAGES + ("frame",)).items()},
+            "per_frame": self.means(("pixels", "drawn", "tk_calls")),
+        }
+
+    def hud_text(self):
+        last = self.frames[-1]
+        p = self.percentiles()
+        stages = "  ".join(f"{stage} {last[stage] * 1000:.1f}" for stage in self.STAGES)
+        return (f"frame {last['frame'] * 1000:.1f} ms | p50 {p[50] * 1000:.1f}  "
+                f"p95 {p[95] * 1000:.1f}  p99 {p[99] * 1000:.1f}\n"
+                f"{stages} ms\n"
+                f"pixels {last['pixels']}  drawn {last['drawn']}  tk calls {last['tk_calls']}")
+
+    def export_csv(self, path):
+        columns = ("frame",) + self.STAGES
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index"] + [f"{c}_ms" for c in columns] + ["pixels", "drawn", "tk_calls"])
+            for i, frame in enumerate(self.frames):
+                writer.writerow([i] + [round(frame[c] * 1000, 4) for c in columns]
+                                + [frame["pixels"], frame["drawn"], frame["tk_calls"]])
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"summary": self.summary(), "frames": list(self.frames)}, f)
+
+    def export(self, path):
+        if path.lower().endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+
+class FrameScheduler:
+    # Measures what each animation tick costs and adapts the work done per tick
+    # and the delay before the next one, so ticks land near the target frame time
+    # with some of it left over for Tk to handle input.
+    def __init__(self, target_ms=30, work=500, min_work=50, max_work=None, headroom=0.8):
+        self.target = target_ms / 1000
+        self.budget = self.target * headroom
+        self.work = work
+        self.min_work = min_work
+        self.max_work = max_work if max_work is not None else work
+        self.cost = None
+        self.interval = None
+        self.tick_start = None
+
+    def begin(self):
+        now = time.perf_counter()
+        if self.tick_start is not None:
+            interval = now - self.tick_start
+            self.interval = interval if self.interval is None else self.interval * 0.9 + interval * 0.1
+        self.tick_start = now
+
+    def end(self):
+        # Returns the delay in ms to hand to root.after()
+        cost = time.perf_counter() - self.tick_start
+        self.cost = cost if self.cost is None else self.cost * 0.8 + cost * 0.2
+
+        # Move the work halfway towards what would fit the budget
+        scale = min(2.0, max(0.5, self.budget / max(self.cost, 1e-6)))
+        work = self.work * (1 + (scale - 1) * 0.5)
+        self.work = int(min(self.max_work, max(self.min_work, work)))
+
+        return max(1, int((self.target - cost) * 1000))
+
+    @property
+    def fps(self):
+        return 1 / self.interval if self.interval else 0.0
+
+
+FrameParams = collections.namedtuple("FrameParams", "style intensity radius fixed_step render_mode")
+
+RenderedFrame = collections.namedtuple("RenderedFrame", "colors x y image spikes record")
+
+
+class FrameWorker(threading.Thread):
+    # Calls compute() about once per interval on its own thread and keeps only
+    # the newest result. A frame nobody took before the next one finished is
+    # dropped, so a slow consumer always presents the latest frame instead of
+    # working through a backlog.
+    def __init__(self, compute, interval):
+        super().__init__(name="frame-worker", daemon=True)
+        self.compute = compute
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.latest = None
+        self.dropped = 0
+        self.error = None
+        self.stopping = threading.Event()
+
+    def run(self):
+        next_tick = time.perf_counter()
+        while not self.stopping.is_set():
+            try:
+                frame = self.compute()
+            except Exception as e:
+                self.error = e
+                return
+            with self.lock:
+                if self.latest is not None:
+                    self.dropped += 1
+                self.latest = frame
+
+            now = time.perf_counter()
+            # When behind, start the next frame now rather than catching up
+            next_tick = max(next_tick + self.interval, now)
+            self.stopping.wait(next_tick - now)
+
+    def take(self):
+        with self.lock:
+            frame, self.latest = self.latest, None
+        return frame
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+
 
 class QuantumSpikeAnimator:
+    PHYSICS_STEP = 0.03
+    MAX_PHYSICS_STEPS = 5
+    RELAYOUT_DELAY = 200  # ms of quiet after the last resize event
+
     def __init__(self, root):
         self.root = root
         self.root.title("🎨 QUANTUM SPIKE ART")
         self.root.configure(bg="#0a0a0a")
         
         # Neural Style Transfer System
-        self.style_patterns = {
-            "Van Gogh": self.van_gogh_style,
-            "Pixel Art": self.pixel_art_style,
-            "Cyberpunk": self.cyberpunk_style,
-        }
         self.current_style = "Normal"
         
         # Quantum Spike System
-        self.quantum_spikes = []
+        self.quantum_spikes = SpikeStore()
+        self.spike_frame = None
         
         # Animation control
         self.animation_running = False
         
+        # "Image" blits each frame as one PhotoImage, "Rectangles" keeps one item per pixel
+        self.render_mode = "Image"
+        self.hud_item = None
+        
+        # Frames are computed on a worker thread; spike changes made from the UI
+        # while it runs are queued for it to apply between frames
+        self.worker = None
+        self.spike_commands = queue.SimpleQueue()
+        self.spike_total = 0
+        
+        # Prepared pixel grids of recently opened images
+        self.grid_loader = GridLoader()
+        self.relayout_job = None
+        
+        # Session recording, and the frames of a session being replayed
+        self.recorder = None
+        self.recorded_params = None
+        self.replay = None
+        
         self.setup_ui()
         
     def setup_ui(self):
         # Main canvas
         self.canvas = tk.Canvas(self.root, bg="#000010", highlightthickness=0)
         self.canvas.pack(fill="both", expand=True, padx=10, pady=10)
+        self.canvas.bind("<Configure>", self.canvas_resized)
         
         # Control Panel
         control_frame = tk.Frame(self.root, bg="#001122", relief='ridge', bd=2)
@@ -43,10 +1291,21 @@ class QuantumSpikeAnimator:
         
         self.style_var = tk.StringVar(value="Normal")
         style_combo = ttk.Combobox(style_frame, textvariable=self.style_var,
-                                  values=["Normal"] + list(self.style_patterns.keys()),
+                                  values=STYLE_NAMES,
                                   state="readonly", width=12)
         style_combo.pack(side="left", padx=2)
         style_combo.bind('<<ComboboxSelected>>', self.change_style)
+        # Appends the selected style to the current ones, e.g. Pixel Art + Cyberpunk
+        tk.Button(style_frame, text="➕ Chain", command=self.chain_style,
+                 bg="#004466", fg="white", font=("Arial", 8)).pack(side="left", padx=2)
+        
+        tk.Label(style_frame, text="Render:", bg="#001122", fg="white").pack(side="left", padx=(10, 0))
+        self.render_var = tk.StringVar(value=self.render_mode)
+        render_combo = ttk.Combobox(style_frame, textvariable=self.render_var,
+                                   values=["Image", "Rectangles"],
+                                   state="readonly", width=10)
+        render_combo.pack(side="left", padx=2)
+        render_combo.bind('<<ComboboxSelected>>', self.change_render_mode)
         
         # Spike Animation Controls
         spike_frame = tk.LabelFrame(control_frame, text="⚡ SPIKE ANIMATION", 
@@ -84,6 +1343,16 @@ class QuantumSpikeAnimator:
                                length=80, bg="#002211", fg="#00ff00")
         radius_scale.pack(side="left", padx=2)
         
+        tk.Label(param_frame, text="Spikes:", bg="#001122", fg="white").pack(side="left")
+        self.spike_count_var = tk.IntVar(value=6)
+        tk.Spinbox(param_frame, from_=1, to=5000, textvariable=self.spike_count_var,
+                   width=5, bg="#001122", fg="white").pack(side="left", padx=2)
+        
+        # Advance spike physics by real elapsed time in fixed steps
+        self.fixed_step_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(param_frame, text="Fixed timestep", variable=self.fixed_step_var,
+                       bg="#001122", fg="white", selectcolor="#002244").pack(side="left", padx=5)
+        
         # Basic controls
         basic_frame = tk.Frame(control_frame, bg="#001122")
         basic_frame.pack(fill="x", padx=5, pady=2)
@@ -97,6 +1366,36 @@ class QuantumSpikeAnimator:
         tk.Button(basic_frame, text="❌ Clear", command=self.clear_spikes,
                  bg="#660000", fg="white").pack(side="left", padx=2)
         
+        # Timing overlay while running, CSV/JSON export on stop
+        self.profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(basic_frame, text="📊 Profile", variable=self.profile_var,
+                       command=self.toggle_profile_hud, bg="#001122", fg="white",
+                       selectcolor="#002244").pack(side="left", padx=5)
+        
+        # Compute frames off the Tk thread so the controls stay responsive
+        self.threaded_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(basic_frame, text="Worker thread", variable=self.threaded_var,
+                       command=self.toggle_worker, bg="#001122", fg="white",
+                       selectcolor="#002244").pack(side="left", padx=5)
+        
+        # Processes rendering tiles of each frame, applied on the next Start
+        tk.Label(basic_frame, text="Cores:", bg="#001122", fg="white").pack(side="left")
+        self.cores_var = tk.IntVar(value=1)
+        tk.Spinbox(basic_frame, from_=1, to=available_cores(), textvariable=self.cores_var,
+                   width=3, bg="#001122", fg="white").pack(side="left", padx=2)
+        
+        # Log the next run to a session file that replays it frame for frame
+        self.record_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(basic_frame, text="⏺ Record", variable=self.record_var,
+                       bg="#001122", fg="white", selectcolor="#002244").pack(side="left", padx=5)
+        tk.Button(basic_frame, text="🔁 Replay", command=self.replay_session,
+                 bg="#333333", fg="white").pack(side="left", padx=2)
+        
+        # The worker never touches Tk variables, it reads this snapshot instead
+        for var in (self.intensity_var, self.radius_var, self.fixed_step_var):
+            var.trace_add("write", self.publish_params)
+        self.publish_params()
+        
         # Status display
         self.status_var = tk.StringVar(value="Ready - Upload image to start")
         status_label = tk.Label(self.root, textvariable=self.status_var,
@@ -109,217 +1408,105 @@ class QuantumSpikeAnimator:
     
     def change_style(self, event=None):
         self.current_style = self.style_var.get()
+        self.publish_params()
         self.status_var.set(f"Style: {self.current_style}")
     
-    def van_gogh_style(self, r, g, b, x, y, t):
-        swirl = math.sin(x * 0.05 + y * 0.03 + t * 2) * 80
-        r = (r + swirl * 0.8) % 256
-        g = (g + swirl * 0.6) % 256  
-        b = (b + swirl * 0.4) % 256
-        return int(r), int(g), int(b)
-    
-    def pixel_art_style(self, r, g, b, x, y, t):
-        r = (r // 32) * 32
-        g = (g // 32) * 32
-        b = (b // 32) * 32
-        return r, g, b
+    def chain_style(self):
+        style = self.style_var.get()
+        if self.current_style == "Normal":
+            self.current_style = style
+        elif style != "Normal":
+            self.current_style = f"{self.current_style} + {style}"
+        self.publish_params()
+        self.status_var.set(f"Style: {self.current_style}")
     
-    def cyberpunk_style(self, r, g, b, x, y, t):
-        pulse = (math.sin(t * 4 + x * 0.02) + 1) * 0.5
-        r = int(r * 0.2 + 255 * pulse * 0.8)
-        g = int(g * 0.3 + 100 * pulse * 0.5)
-        b = int(b * 0.1 + 255 * pulse * 0.9)
-        return r, g, b
+    def publish_params(self, *args):
+        # Replacing the whole tuple is atomic, so the worker sees either the old
+        # settings or the new ones and neither side has to take a lock
+        self.frame_params = FrameParams(self.current_style, self.intensity_var.get(),
+                                        self.radius_var.get(), self.fixed_step_var.get(),
+                                        self.render_mode)
     
-    def apply_style_transfer(self, r, g, b, x, y, t):
-        if self.current_style == "Normal":
-            return r, g, b
-        style_function = self.style_patterns.get(self.current_style)
-        if style_function:
-            return style_function(r, g, b, x, y, t)
-        return r, g, b
-
     # ==================== SPIKE ANIMATION SYSTEM ====================
     
     def generate_spikes(self, animation_type):
         if not self.animation_running:
             messagebox.showinfo("Info", "Please start animation first!")
             return
+        if self.replay is not None:
+            self.status_var.set("Spikes can't be changed during a replay")
+            return
             
-        self.quantum_spikes = []
-        num_spikes = 6
-        
-        center_x, center_y = self.w // 2, self.h // 2
-        
-        for i in range(num_spikes):
-            if animation_type == "spiral":
-                spike = self.create_spiral_spike(i, num_spikes, center_x, center_y)
-            elif animation_type == "shooting":
-                spike = self.create_shooting_spike(i, center_x, center_y)
-            elif animation_type == "orbit":
-                spike = self.create_orbiting_spike(i, num_spikes, center_x, center_y)
-            elif animation_type == "bounce":
-                spike = self.create_bouncing_spike(i, center_x, center_y)
-            else:
-                spike = self.create_spiral_spike(i, num_spikes, center_x, center_y)
-                
-            self.quantum_spikes.append(spike)
-            
+        num_spikes = max(1, self.spike_count_var.get())
+        params = self.frame_params
+        
+        def generate():
+            self.quantum_spikes.clear()
+            self.quantum_spikes.create_spikes(animation_type, num_spikes, self.w, self.h,
+                                              params.intensity, params.radius)
+            self.rebuild_spike_frame()
+            if self.recorder is not None:
+                self.recorder.event("spikes", spike_type=animation_type, count=num_spikes,
+                                    intensity=params.intensity, radius=params.radius)
+        
+        self.run_spike_command(generate)
         animation_names = {
             "spiral": "Spiral", "shooting": "Shooting Stars", 
             "orbit": "Orbit", "bounce": "Bouncing"
         }
         self.status_var.set(f"{animation_names[animation_type]} - {num_spikes} spikes")
-
-    def create_spiral_spike(self, index, total, center_x, center_y):
-        angle = (index / total) * 2 * math.pi
-        return {
-            'type': 'spiral',
-            'x': center_x,
-            'y': center_y,
-            'angle': angle,
-            'radius': 20,
-            'speed': 0.5,
-            'color_shift': (index / total) * 2 * math.pi,
-            'intensity': self.intensity_var.get(),
-            'effect_radius': self.radius_var.get(),
-        }
-    
-    def create_shooting_spike(self, index, center_x, center_y):
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(50, 150)
-        start_x = center_x + math.cos(angle) * distance
-        start_y = center_y + math.sin(angle) * distance
-        
-        dx = center_x - start_x
-        dy = center_y - start_y
-        length = math.sqrt(dx*dx + dy*dy)
-        move_x = dx / length if length > 0 else 0
-        move_y = dy / length if length > 0 else 0
-        
-        return {
-            'type': 'shooting',
-            'x': start_x,
-            'y': start_y,
-            'move_x': move_x,
-            'move_y': move_y,
-            'speed': 1.0,
-            'color_shift': random.uniform(0, 2 * math.pi),
-            'intensity': self.intensity_var.get() * 1.2,
-            'effect_radius': self.radius_var.get() * 0.6,
-        }
-    
-    def create_orbiting_spike(self, index, total, center_x, center_y):
-        orbit_radius = 60 + index * 10
-        return {
-            'type': 'orbit',
-            'x': center_x + orbit_radius,
-            'y': center_y,
-            'orbit_radius': orbit_radius,
-            'orbit_angle': (index / total) * 2 * math.pi,
-            'speed': 0.2,
-            'color_shift': (index / total) * 2 * math.pi,
-            'intensity': self.intensity_var.get(),
-            'effect_radius': self.radius_var.get() * 0.6,
-        }
-    
-    def create_bouncing_spike(self, index, center_x, center_y):
-        start_x = random.uniform(50, self.w - 50)
-        start_y = random.uniform(50, self.h - 50)
-        angle = random.uniform(0, 2 * math.pi)
-        
-        return {
-            'type': 'bounce',
-            'x': start_x,
-            'y': start_y,
-            'move_x': math.cos(angle),
-            'move_y': math.sin(angle),
-            'speed': 0.8,
-            'color_shift': random.uniform(0, 2 * math.pi),
-            'intensity': self.intensity_var.get(),
-            'effect_radius': self.radius_var.get() * 0.5,
-        }
     
     def clear_spikes(self):
-        self.quantum_spikes = []
+        if self.replay is not None:
+            self.status_var.set("Spikes can't be changed during a replay")
+            return
+
+        def clear():
+            self.quantum_spikes.clear()
+            self.rebuild_spike_frame()
+            if self.recorder is not None:
+                self.recorder.event("clear")
+        
+        self.run_spike_command(clear)
         self.status_var.set("Spikes cleared")
     
-    def update_spike_animations(self, t):
-        for spike in self.quantum_spikes:
-            if spike['type'] == 'spiral':
-                self.update_spiral_spike(spike, t)
-            elif spike['type'] == 'shooting':
-                self.update_shooting_spike(spike, t)
-            elif spike['type'] == 'orbit':
-                self.update_orbiting_spike(spike, t)
-            elif spike['type'] == 'bounce':
-                self.update_bouncing_spike(spike, t)
+    def run_spike_command(self, command):
+        # While the worker owns the spikes, hand it the change instead
+        if self.worker is not None:
+            self.spike_commands.put(command)
+        else:
+            command()
     
-    def update_spiral_spike(self, spike, t):
-        spike['radius'] += spike['speed'] * 0.8
-        spike['angle'] += 0.05
-        spike['x'] = self.w // 2 + math.cos(spike['angle']) * spike['radius']
-        spike['y'] = self.h // 2 + math.sin(spike['angle']) * spike['radius']
-        spike['color_shift'] += 0.02
+    def run_pending_spike_commands(self):
+        while True:
+            try:
+                command = self.spike_commands.get_nowait()
+            except queue.Empty:
+                return
+            command()
     
-    def update_shooting_spike(self, spike, t):
-        spike['x'] += spike['move_x'] * spike['speed'] * 2
-        spike['y'] += spike['move_y'] * spike['speed'] * 2
-        spike['color_shift'] += 0.04
-        
-        if (spike['x'] < -100 or spike['x'] > self.w + 100 or 
-            spike['y'] < -100 or spike['y'] > self.h + 100):
-            angle = random.uniform(0, 2 * math.pi)
-            distance = random.uniform(50, 150)
-            spike['x'] = self.w // 2 + math.cos(angle) * distance
-            spike['y'] = self.h // 2 + math.sin(angle) * distance
+    def update_spike_animations(self, t, steps=1):
+        for _ in range(steps):
+            self.quantum_spikes.update(self.w, self.h, t)
+        self.rebuild_spike_frame()
     
-    def update_orbiting_spike(self, spike, t):
-        spike['orbit_angle'] += spike['speed']
-        spike['x'] = self.w // 2 + math.cos(spike['orbit_angle']) * spike['orbit_radius']
-        spike['y'] = self.h // 2 + math.sin(spike['orbit_angle']) * spike['orbit_radius']
-        spike['color_shift'] += 0.015
+    def physics_steps(self):
+        # Whole fixed steps covered by the real time since the last tick. Each
+        # spike update was tuned for one 30 ms tick, so that is the step size.
+        now = time.perf_counter()
+        self.physics_lag += now - self.last_tick
+        self.last_tick = now
+        steps = int(self.physics_lag / self.PHYSICS_STEP)
+        if steps > self.MAX_PHYSICS_STEPS:
+            # Too far behind to catch up; drop the backlog rather than stall
+            steps = self.MAX_PHYSICS_STEPS
+            self.physics_lag = 0.0
+        else:
+            self.physics_lag -= steps * self.PHYSICS_STEP
+        return steps
     
-    def update_bouncing_spike(self, spike, t):
-        spike['x'] += spike['move_x'] * spike['speed']
-        spike['y'] += spike['move_y'] * spike['speed']
-        spike['color_shift'] += 0.02
-        
-        if spike['x'] <= 0 or spike['x'] >= self.w:
-            spike['move_x'] *= -1
-        if spike['y'] <= 0 or spike['y'] >= self.h:
-            spike['move_y'] *= -1
-
-    def apply_spike_effects(self, r, g, b, x, y, t):
-        if not self.quantum_spikes:
-            return r, g, b
-            
-        total_effect_r = 0
-        total_effect_g = 0  
-        total_effect_b = 0
-        
-        for spike in self.quantum_spikes:
-            dx = x - spike['x']
-            dy = y - spike['y']
-            distance = math.sqrt(dx*dx + dy*dy)
-            
-            if distance < spike['effect_radius']:
-                intensity = (1 - distance / spike['effect_radius']) * spike['intensity']
-                color_shift = spike['color_shift']
-                
-                r_shift = math.sin(color_shift) * 60 * intensity
-                g_shift = math.cos(color_shift) * 60 * intensity
-                b_shift = math.sin(color_shift + math.pi/2) * 60 * intensity
-                
-                total_effect_r += r_shift
-                total_effect_g += g_shift
-                total_effect_b += b_shift
-        
-        r = max(0, min(255, r + total_effect_r))
-        g = max(0, min(255, g + total_effect_g))
-        b = max(0, min(255, b + total_effect_b))
-        
-        return int(r), int(g), int(b)
+    def rebuild_spike_frame(self):
+        self.spike_frame = SpikeFrame(self.quantum_spikes)
 
     # ==================== CORE SYSTEM ====================
     
@@ -331,153 +1518,966 @@ class QuantumSpikeAnimator:
             return
             
         try:
-            self.image = Image.open(path).convert("RGB")
-            self.prepare_pixels()
+            # A replay runs on the player's engine, which is about to be closed
+            if self.replay is not None:
+                self.stop_animation()
+            # The worker must not be mid-frame while the engine is replaced
+            self.stop_worker()
+            self.prepare_pixels(path)
+            # A session can't be replayed across an image change
+            self.finish_recording()
             self.status_var.set(f"Loaded: {os.path.basename(path)}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image: {str(e)}")
+        finally:
+            if self.animation_running:
+                self.start_worker()
     
-    def prepare_pixels(self):
-        self.canvas.delete("all")
+    def prepare_pixels(self, path):
         w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
         if w <= 1 or h <= 1:
             w, h = 800, 600
             
-        self.pixel_size = max(2, min(8, w // 150))
-        
-        self.resized = self.image.resize((w//self.pixel_size, h//self.pixel_size))
-        self.pixels = self.resized.load()
+        self.pixel_size, self.resized = self.grid_loader.load(path, w, h)
+        self.image_path = path
+        self.canvas_size = (w, h)
         self.w, self.h = self.resized.size
 
-        self.pixel_list = []
-        self.pixel_objects = {}
-        self.pixel_vel = {}
-        self.original_positions = {}  # Store original positions
-        
-        for x in range(self.w):
-            for y in range(self.h):
-                px, py = float(x), float(y)
-                pixel_id = (px, py)
-                
-                vx = random.uniform(-1, 1)
-                vy = random.uniform(-1, 1)
-                
-                self.pixel_vel[pixel_id] = (vx, vy)
-                self.pixel_list.append([px, py])
-                self.original_positions[pixel_id] = (px, py)  # Save original position
-                
-                r, g, b = self.pixels[x, y]
-                color = f"#{r:02x}{g:02x}{b:02x}"
-                
-                rect = self.canvas.create_rectangle(
-                    px*self.pixel_size, py*self.pixel_size,
-                    px*self.pixel_size+self.pixel_size, 
-                    py*self.pixel_size+self.pixel_size,
-                    fill=color, outline=color
-                )
-                self.pixel_objects[pixel_id] = rect
+        self.set_engine(make_engine(self.resized, self.pixel_size, cores=self.cores_var.get()))
+        self.create_canvas_items()
+        self.reset_frame_budget()
+        self.status_var.set(f"{len(self.engine)} pixels ready")
 
+    def reset_frame_budget(self):
+        # Rectangle updates per frame, and where the next partial update
+        # starts, for a newly installed engine. The scheduler's costs were
+        # measured on the old one, so it starts over too.
         self.index = 0
-        self.pixels_per_frame = min(500, max(50, len(self.pixel_list)//200))
-        self.status_var.set(f"{len(self.pixel_list)} pixels ready")
+        self.pixels_per_frame = min(500, max(50, len(self.engine)//200))
+        self.scheduler = FrameScheduler(work=self.pixels_per_frame, max_work=len(self.engine))
+
+    def set_engine(self, engine):
+        # Replaced engines may own a process pool and shared memory
+        if hasattr(self, 'engine'):
+            self.engine.close()
+        self.engine = engine
+        # A running animation keeps profiling the stages of the new engine
+        if self.animation_running and getattr(self, 'profiler', None) is not None:
+            engine.profiler = self.profiler
+
+    def canvas_resized(self, event):
+        # A window drag fires a stream of these; only act once it settles
+        if not hasattr(self, 'engine'):
+            return
+        if self.relayout_job is not None:
+            self.root.after_cancel(self.relayout_job)
+        self.relayout_job = self.root.after(self.RELAYOUT_DELAY, self.relayout)
+
+    def relayout(self):
+        self.relayout_job = None
+        if self.replay is not None:
+            return  # a replay keeps the grid sizes it recorded
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w <= 1 or h <= 1:
+            return
+        try:
+            pixel_size, resized = self.grid_loader.load(self.image_path, w, h)
+        except OSError as e:
+            self.status_var.set(f"Resize failed: {e}")
+            return
+        if pixel_size == self.pixel_size and resized.size == (self.w, self.h):
+            return
+
+        # Rescale the running animation in place instead of reloading
+        self.stop_worker()
+        old_w, old_h = self.w, self.h
+        self.pixel_size, self.resized = pixel_size, resized
+        self.w, self.h = resized.size
+        self.engine.resize(resized, pixel_size)
+        self.quantum_spikes.rescale(self.w / old_w, self.h / old_h)
+        self.rebuild_spike_frame()
+        self.canvas_size = (w, h)
+        if self.recorder is not None:
+            self.recorder.event("resize", canvas=[w, h])
+        self.resize_canvas_items()
+        if self.animation_running:
+            self.scheduler.max_work = len(self.engine)
+            self.start_worker()
+        else:
+            self.repaint_source()
+        self.status_var.set(f"Resized to {self.w}x{self.h} pixels")
+
+    def resize_canvas_items(self):
+        if self.render_mode == "Image":
+            # One image item; only its backing PhotoImage changes size
+            self.photo = ImageTk.PhotoImage(Image.fromarray(self.engine.source_frame()))
+            self.canvas.itemconfig(self.image_item, image=self.photo)
+            self.reset_shown_state()
+            return
+
+        # Keep the existing rectangles as the first pixels of the new grid,
+        # dropping or adding only the difference
+        count = len(self.engine)
+        items = self.pixel_items
+        if count < items.size:
+            self.canvas.delete(*items[count:].tolist())
+            items = items[:count]
+        elif count > items.size:
+            ps = self.pixel_size
+            added = [self.canvas.create_rectangle(0, 0, ps, ps, outline="")
+                     for _ in range(count - items.size)]
+            items = np.concatenate((items, np.array(added, dtype=np.int64)))
+        self.pixel_items = items
+        if self.hud_item is not None:
+            self.canvas.tag_raise(self.hud_item)
+
+        # Nothing on screen matches the new grid yet, so every pixel is dirty
+        # and gets repainted over the next ticks within the per-tick budget
+        self.shown_colors = np.full(count, -1, dtype=np.int64)
+        self.shown_x = np.full(count, -1, dtype=np.int64)
+        self.shown_y = np.full(count, -1, dtype=np.int64)
+
+    def create_canvas_items(self):
+        self.canvas.delete("all")
+        self.hud_item = None
+        # Canvas item of each pixel, indexed by the engine's stable pixel id
+        self.pixel_items = np.empty(0, dtype=np.int64)
+        
+        if self.render_mode == "Image":
+            # A single image item, repainted from the engine's frame buffer
+            self.photo = ImageTk.PhotoImage(Image.fromarray(self.engine.source_frame()))
+            self.image_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            self.reset_shown_state()
+            return
+        
+        ps = self.pixel_size
+        items = []
+        for (r, g, b), x, y in zip(self.engine.src.reshape(-1, 3).tolist(),
+                                   self.engine.origin_x.tolist(), self.engine.origin_y.tolist()):
+            color = f"#{r:02x}{g:02x}{b:02x}"
+            items.append(self.canvas.create_rectangle(x*ps, y*ps, x*ps+ps, y*ps+ps,
+                                                      fill=color, outline=color))
+        self.pixel_items = np.array(items, dtype=np.int64)
+        self.reset_shown_state()
+
+    def reset_shown_state(self):
+        # What the canvas currently displays, so only changes are pushed to Tk
+        if self.render_mode == "Image":
+            self.shown_frame = self.engine.source_frame()
+            return
+        self.shown_colors = pack_colors(self.engine.src.reshape(-1, 3))
+        self.shown_x = (self.engine.origin_x * self.pixel_size).astype(np.int64)
+        self.shown_y = (self.engine.origin_y * self.pixel_size).astype(np.int64)
+
+    def change_render_mode(self, event=None):
+        self.render_mode = self.render_var.get()
+        self.publish_params()
+        if hasattr(self, 'engine'):
+            self.create_canvas_items()
+        self.status_var.set(f"Render: {self.render_mode}")
 
     def start_animation(self):
-        if not hasattr(self, 'pixel_list') or not self.pixel_list:
+        if not hasattr(self, 'engine'):
             messagebox.showwarning("Warning", "Please load an image first!")
             return
+        if self.replay is not None:
+            self.stop_animation()
+        if self.record_var.get():
+            self.start_recording()
+        elif self.engine.workers != self.cores_var.get():
+            self.set_engine(make_engine(self.resized, self.pixel_size, cores=self.cores_var.get()))
             
         self.animation_running = True
         self.start_time = time.time()
         self.frame_count = 0
+        self.scheduler = FrameScheduler(work=self.pixels_per_frame, max_work=len(self.engine))
+        self.profiler = FrameProfiler()
+        self.engine.profiler = self.profiler
+        self.last_tick = time.perf_counter()
+        self.physics_lag = 0.0
+        self.start_worker()
         self.status_var.set("Animation started")
         self.animate()
 
     def stop_animation(self):
         self.animation_running = False
+        self.stop_worker()
+        self.replay = None
         self.status_var.set("Animation stopped")
+        if self.profile_var.get() and getattr(self, 'profiler', None) and self.profiler.frames:
+            self.export_profile()
+        path = self.finish_recording()
+        if path:
+            self.status_var.set(f"{self.status_var.get()} | session saved to {path}")
         
         # Reset all pixels to their original positions
-        if hasattr(self, 'original_positions'):
-            for i in range(len(self.pixel_list)):
-                px, py = self.pixel_list[i]
-                pixel_id = (px, py)
-                if pixel_id in self.original_positions:
-                    orig_x, orig_y = self.original_positions[pixel_id]
-                    self.pixel_list[i] = [orig_x, orig_y]
-                    
-                    # Update display immediately
-                    if pixel_id in self.pixel_objects:
-                        rect = self.pixel_objects[pixel_id]
-                        self.canvas.coords(rect, 
-                                         orig_x*self.pixel_size, orig_y*self.pixel_size,
-                                         orig_x*self.pixel_size+self.pixel_size, 
-                                         orig_y*self.pixel_size+self.pixel_size)
-                        
-                        # Reset to original color
-                        x_int, y_int = int(orig_x), int(orig_y)
-                        if 0 <= x_int < self.w and 0 <= y_int < self.h:
-                            try:
-                                r, g, b = self.pixels[x_int, y_int]
-                                color = f"#{r:02x}{g:02x}{b:02x}"
-                                self.canvas.itemconfig(rect, fill=color)
-                            except (IndexError, TypeError):
-                                pass
+        if hasattr(self, 'engine'):
+            self.engine.reset_positions()
+            self.repaint_source()
 
-    def animate(self):
-        if not self.animation_running:
+    def repaint_source(self):
+        # Show the untouched image right away, outside the animation loop
+        self.reset_shown_state()
+        if self.render_mode == "Image":
+            self.photo.paste(Image.fromarray(self.shown_frame))
             return
+        
+        for rect, color, x, y in zip(self.pixel_items.tolist(), self.shown_colors.tolist(),
+                                     self.shown_x.tolist(), self.shown_y.tolist()):
+            self.canvas.coords(rect, x, y, x + self.pixel_size, y + self.pixel_size)
+            self.canvas.itemconfig(rect, fill=f"#{color:06x}")
 
-        current_time = time.time() - self.start_time
+    def start_recording(self):
+        # A fresh seed drives the pixel velocities and every spike from here on,
+        # the same way SessionPlayer will when replaying
+        seed = int(np.random.default_rng().integers(2**31))
+        rng = np.random.default_rng(seed)
+        self.set_engine(make_engine(self.resized, self.pixel_size, rng, self.cores_var.get()))
+        self.quantum_spikes = SpikeStore(rng)
+        self.rebuild_spike_frame()
+        path = f"spike_session_{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+        self.recorder = SessionRecorder(path, seed, self.image_path, self.canvas_size)
+        self.recorded_params = None
 
-        # Update spike animations
-        self.update_spike_animations(current_time)
+    def record_frame(self, params, t, steps):
+        if params is not self.recorded_params:
+            self.recorder.event("params", style=params.style, intensity=params.intensity,
+                                radius=params.radius, fixed_step=params.fixed_step)
+            self.recorded_params = params
+        self.recorder.frame(t, steps)
 
-        for _ in range(self.pixels_per_frame):
-            if self.index >= len(self.pixel_list):
-                self.index = 0
+    def finish_recording(self):
+        if self.recorder is None:
+            return None
+        self.recorder.close()
+        path, self.recorder = self.recorder.path, None
+        return path
 
-            px, py = self.pixel_list[self.index]
-            pixel_id = (px, py)
-            x_int, y_int = int(px) % self.w, int(py) % self.h
+    def replay_session(self):
+        path = filedialog.askopenfilename(filetypes=[("Spike sessions", "*.jsonl.gz")])
+        if not path:
+            return
+        if self.animation_running:
+            self.stop_animation()
+        try:
+            player = SessionPlayer(path, cores=self.cores_var.get())
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Failed to load session: {e}")
+            return
 
-            try:
-                r, g, b = self.pixels[x_int, y_int]
-            except (IndexError, TypeError):
-                self.index += 1
-                continue
+        # Take over the player's engine and spikes so frames show on the canvas
+        self.player = player
+        self.set_engine(player.engine)
+        self.quantum_spikes = player.spikes
+        self.image_path, self.canvas_size = player.image_path, player.canvas_size
+        self.pixel_size, self.w, self.h = self.engine.pixel_size, self.engine.w, self.engine.h
+        self.resized = Image.fromarray(self.engine.src)
+        self.create_canvas_items()
+        self.reset_frame_budget()
 
-            r, g, b = self.apply_style_transfer(r, g, b, px, py, current_time)
-            r, g, b = self.apply_spike_effects(r, g, b, px, py, current_time)
+        self.animation_running = True
+        self.start_time = time.time()
+        self.frame_count = 0
+        self.profiler = FrameProfiler()
+        self.replay = player.frames(self.profiler)
+        self.status_var.set(f"Replaying {player.frame_count} frames from {os.path.basename(path)}")
+        self.replay_tick()
 
-            color = f"#{r:02x}{g:02x}{b:02x}"
-            
-            if pixel_id in self.pixel_objects:
-                rect = self.pixel_objects[pixel_id]
-                self.canvas.coords(rect, 
-                                 px*self.pixel_size, py*self.pixel_size,
-                                 px*self.pixel_size+self.pixel_size, 
-                                 py*self.pixel_size+self.pixel_size)
-                self.canvas.itemconfig(rect, fill=color)
-
-            # Update pixel position
-            if pixel_id in self.pixel_vel:
-                vx, vy = self.pixel_vel[pixel_id]
-                new_x = (px + vx * 0.1) % self.w
-                new_y = (py + vy * 0.1) % self.h
-                self.pixel_list[self.index] = [new_x, new_y]
-
-            self.index += 1
+    def replay_tick(self):
+        # Recorded frames are shown back to back, as fast as they are computed
+        if not self.animation_running or self.replay is None:
+            return
+        self.scheduler.begin()
+        try:
+            colors, xs, ys = next(self.replay)
+        except StopIteration:
+            frames = self.frame_count
+            self.stop_animation()
+            self.status_var.set(f"Replay finished: {frames} frames")
+            return
+
+        engine = self.engine
+        if (engine.w, engine.h) != (self.w, self.h):
+            # The session was resized here
+            self.pixel_size, self.w, self.h = engine.pixel_size, engine.w, engine.h
+            self.resize_canvas_items()
+        if self.player.style != self.current_style:
+            self.current_style = self.player.style
+            self.publish_params()
+
+        image = None
+        if self.render_mode == "Image":
+            with self.profiler.stage("compose"):
+                image = engine.compose(colors, xs, ys)
+        self.present_frame(RenderedFrame(colors, xs, ys, image, len(self.quantum_spikes),
+                                         self.profiler.take()))
+        self.scheduler.end()
+        self.root.after(1, self.replay_tick)
+
+    def start_worker(self):
+        if self.worker is not None or not self.threaded_var.get():
+            return
+        self.worker = FrameWorker(self.compute_frame, self.scheduler.target)
+        self.worker.start()
+
+    def stop_worker(self):
+        if self.worker is None:
+            return
+        self.worker.stop()
+        self.worker = None
+        # Anything the worker didn't get to is applied here instead
+        self.run_pending_spike_commands()
+
+    def toggle_worker(self):
+        # A replay renders on the Tk thread only
+        if not self.animation_running or self.replay is not None:
+            return
+        if self.threaded_var.get():
+            self.start_worker()
+        else:
+            self.stop_worker()
+
+    def export_profile(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for ext in ("json", "csv"):
+            self.profiler.export(f"spike_profile_{stamp}.{ext}")
+        p = self.profiler.percentiles()
+        self.status_var.set(f"Animation stopped | profile saved to spike_profile_{stamp}.json/.csv"
+                            f" | p50 {p[50] * 1000:.1f} ms  p95 {p[95] * 1000:.1f} ms")
+
+    def toggle_profile_hud(self):
+        if not self.profile_var.get() and self.hud_item is not None:
+            self.canvas.delete(self.hud_item)
+            self.hud_item = None
+
+    def draw_profile_hud(self):
+        text = self.profiler.hud_text()
+        if self.hud_item is None:
+            self.hud_item = self.canvas.create_text(8, 8, anchor="nw", text=text, fill="#00ff00",
+                                                    font=("Courier", 9))
+        else:
+            self.canvas.itemconfig(self.hud_item, text=text)
+        self.canvas.tag_raise(self.hud_item)
+
+    def draw_image(self, frame):
+        with self.profiler.stage("compose"):
+            rects = dirty_rectangles(self.shown_frame, frame)
+            self.shown_frame = frame
+        if not rects:
+            return
+
+        with self.profiler.stage("canvas"):
+            x0, y0, x1, y1 = rects[0]
+            if len(rects) == 1 and (x1 - x0, y1 - y0) == (frame.shape[1], frame.shape[0]):
+                # Everything changed: one paste of the whole frame
+                self.photo.paste(Image.fromarray(frame))
+                self.profiler.count(drawn=len(self.engine), tk_calls=1)
+                return
 
+            # Copy only the changed regions into the displayed image
+            for x0, y0, x1, y1 in rects:
+                region = ImageTk.PhotoImage(Image.fromarray(frame[y0:y1, x0:x1]))
+                self.canvas.tk.call(str(self.photo), "copy", str(region), "-to", x0, y0)
+            self.profiler.count(tk_calls=2 * len(rects))
+
+    def draw_rectangles(self, colors, xs, ys):
+        with self.profiler.stage("canvas"):
+            self.push_rectangles(colors, xs, ys)
+
+    def push_rectangles(self, colors, xs, ys):
+        packed = pack_colors(colors)
+        screen_x = (xs * self.pixel_size).astype(np.int64)
+        screen_y = (ys * self.pixel_size).astype(np.int64)
+        recolored = packed != self.shown_colors
+        moved = (screen_x != self.shown_x) | (screen_y != self.shown_y)
+
+        dirty = np.flatnonzero(recolored | moved)
+        if dirty.size > self.pixels_per_frame:
+            # Round-robin through the dirty pixels so every one gets its turn
+            start = np.searchsorted(dirty, self.index)
+            dirty = np.roll(dirty, -start)[:self.pixels_per_frame]
+            self.index = int(dirty[-1]) + 1
+
+        for rect, color, x, y, recolor, move in zip(
+                self.pixel_items[dirty].tolist(), packed[dirty].tolist(), screen_x[dirty].tolist(),
+                screen_y[dirty].tolist(), recolored[dirty].tolist(), moved[dirty].tolist()):
+            if move:
+                self.canvas.coords(rect, x, y, x + self.pixel_size, y + self.pixel_size)
+            if recolor:
+                self.canvas.itemconfig(rect, fill=f"#{color:06x}")
+
+        self.shown_colors[dirty] = packed[dirty]
+        self.shown_x[dirty] = screen_x[dirty]
+        self.shown_y[dirty] = screen_y[dirty]
+        self.profiler.count(drawn=int(dirty.size),
+                            tk_calls=int(recolored[dirty].sum() + moved[dirty].sum()))
+
+    def compute_frame(self):
+        # Everything up to a finished frame buffer. Runs on the worker thread
+        # when there is one, so it only reads settings from self.frame_params.
+        params = self.frame_params
+        self.profiler.begin_frame()
+        current_time = time.time() - self.start_time
+
+        # Update spike animations
+        with self.profiler.stage("spikes"):
+            self.run_pending_spike_commands()
+            if params.fixed_step:
+                steps = self.physics_steps()
+            else:
+                self.last_tick = time.perf_counter()
+                steps = 1
+            self.update_spike_animations(current_time, steps)
+        if self.recorder is not None:
+            self.record_frame(params, current_time, steps)
+
+        # Compute the whole frame in one batched pass
+        colors, xs, ys = self.engine.render(current_time, params.style, self.spike_frame)
+
+        image = None
+        if params.render_mode == "Image":
+            with self.profiler.stage("compose"):
+                image = self.engine.compose(colors, xs, ys)
+        return RenderedFrame(colors, xs, ys, image, len(self.quantum_spikes), self.profiler.take())
+
+    def present_frame(self, frame):
+        if (frame.image is not None) != (self.render_mode == "Image"):
+            return  # computed before the render mode changed
+
+        self.profiler.resume(frame.record)
+        if self.render_mode == "Image":
+            self.draw_image(frame.image)
+        else:
+            self.draw_rectangles(frame.colors, frame.x, frame.y)
+        self.profiler.end_frame()
         self.frame_count += 1
+        self.spike_total = frame.spikes
+        
+        if self.profile_var.get() and self.frame_count % 10 == 0:
+            self.draw_profile_hud()
         
         if self.frame_count % 30 == 0:
-            spike_info = f"{len(self.quantum_spikes)} spikes" if self.quantum_spikes else "no spikes"
-            self.status_var.set(f"Frame {self.frame_count} | Style: {self.current_style} | {spike_info}")
+            spike_info = f"{self.spike_total} spikes" if self.spike_total else "no spikes"
+            dropped = f" | {self.worker.dropped} dropped" if self.worker is not None else ""
+            self.status_var.set(f"Frame {self.frame_count} | Style: {self.current_style} | {spike_info}"
+                                f" | {self.scheduler.fps:.0f} FPS{dropped}")
 
-        self.root.after(30, self.animate)
+    def animate(self):
+        if not self.animation_running:
+            return
 
+        self.scheduler.begin()
+        if self.worker is None:
+            frame = self.compute_frame()
+        elif self.worker.error is not None:
+            error = self.worker.error
+            self.stop_animation()
+            messagebox.showerror("Error", f"Frame computation failed: {error}")
+            return
+        else:
+            # Present whatever the worker finished last; nothing new means skip
+            frame = self.worker.take()
+        if frame is not None:
+            self.present_frame(frame)
 
-if __name__ == "__main__":
+        # Size the next tick's work and delay from what this one cost
+        delay = self.scheduler.end()
+        self.pixels_per_frame = self.scheduler.work
+        self.root.after(delay, self.animate)
+
+
+# ==================== COMMAND LINE ====================
+
+def parse_size(value):
+    try:
+        w, h = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    if w <= 0 or h <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive, got {value!r}")
+    return w, h
+
+
+def parse_canvas_size(value):
+    # A canvas size that still fits at least one pixel each way
+    w, h = parse_size(value)
+    if 0 in fit_size(w, h)[1]:
+        raise argparse.ArgumentTypeError(f"canvas {value!r} is too small to hold any pixels")
+    return w, h
+
+
+def positive(convert):
+    def parse(value):
+        try:
+            number = convert(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid {convert.__name__} value: {value!r}")
+        if number <= 0:
+            raise argparse.ArgumentTypeError(f"must be positive, got {value!r}")
+        return number
+    return parse
+
+
+def render_options(args):
+    return {
+        'style': args.style,
+        'spike_type': args.spikes,
+        'spike_count': args.spike_count,
+        'canvas_size': args.size,
+        'intensity': args.intensity,
+        'radius': args.radius,
+        'fps': args.fps,
+    }
+
+
+def render_file(path, out, frames, options, seed=None, progress=False, profiler=None):
+    # Decoded straight to grid size; OfflineRenderer's own fit is then a no-op
+    image = load_grid(path, fit_size(*options['canvas_size'])[1])
+    writer = open_frame_writer(out, options['fps'])
+    renderer = OfflineRenderer(image, seed=seed, **options)
+
+    # Frames are written as they are produced, never held as a sequence
+    start = time.perf_counter()
+    try:
+        for n, frame in enumerate(renderer.frames(frames, profiler), 1):
+            writer.write(frame)
+            if progress and (n % 30 == 0 or n == frames):
+                elapsed = time.perf_counter() - start
+                print(f"\rFrame {n}/{frames} | {n / elapsed:.1f} frames/s", end="", flush=True)
+    finally:
+        writer.close()
+        renderer.close()
+    return time.perf_counter() - start
+
+
+def render_command(args):
+    profiler = FrameProfiler() if args.profile else None
+    try:
+        # Tiles of each frame are spread over --cores processes
+        options = dict(render_options(args), cores=args.cores)
+        elapsed = render_file(args.input, args.out, args.frames, options,
+                              seed=args.seed, progress=True, profiler=profiler)
+    except (OSError, ValueError, RuntimeError) as e:
+        sys.exit(f"Error: {e}")
+
+    print(f"\n{args.frames} frames in {elapsed:.2f}s "
+          f"({args.frames / elapsed:.1f} frames/s) -> {args.out}")
+    if profiler is not None:
+        report_profile(profiler, args.profile)
+
+
+def report_profile(profiler, path):
+    profiler.export(path)
+    summary = profiler.summary()
+    print("Frame ms " + "  ".join(f"{k} {v}" for k, v in summary["frame_ms"].items()))
+    print("Stage ms " + "  ".join(f"{k} {v}" for k, v in summary["stage_ms"].items()))
+
+
+def replay_command(args):
+    profiler = FrameProfiler() if args.profile else None
+    try:
+        player = SessionPlayer(args.session, args.input, args.cores)
+        writer = open_frame_writer(args.out, args.fps) if args.out else None
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Error: {e}")
+
+    # The checksum covers every frame's colours and positions, so two replays
+    # of a session can be compared for exact equality
+    checksum = n = 0
+    size = None
+    start = time.perf_counter()
+    try:
+        for n, (colors, xs, ys) in enumerate(player.frames(profiler), 1):
+            checksum = zlib.crc32(colors.tobytes(), checksum)
+            checksum = zlib.crc32(ys.tobytes(), zlib.crc32(xs.tobytes(), checksum))
+            if writer is not None:
+                with player.engine.stage("compose"):
+                    frame = Image.fromarray(player.engine.compose(colors, xs, ys))
+                    # Writers are fixed to the first frame's size; frames after a
+                    # recorded resize are padded or cropped to it
+                    size = size or frame.size
+                    if frame.size != size:
+                        canvas = Image.new("RGB", size, (0, 0, 16))
+                        canvas.paste(frame, (0, 0))
+                        frame = canvas
+                    writer.write(frame)
+            if profiler is not None:
+                profiler.end_frame()
+            if n % 30 == 0 or n == player.frame_count:
+                elapsed = time.perf_counter() - start
+                print(f"\rFrame {n}/{player.frame_count} | {n / elapsed:.1f} frames/s", end="", flush=True)
+    finally:
+        if writer is not None:
+            writer.close()
+        player.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{n} frames in {elapsed:.2f}s ({n / max(elapsed, 1e-9):.1f} frames/s)"
+          f" | checksum {checksum:08x}")
+    if profiler is not None:
+        report_profile(profiler, args.profile)
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+
+def find_images(pattern):
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+
+
+def input_root(pattern):
+    # The directory itself, or the part of a glob before its first wildcard
+    if os.path.isdir(pattern):
+        return pattern
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def batch_jobs(paths, root, out_dir, fmt):
+    # (source, output, relative name) per image. Outputs mirror the sources'
+    # paths under the input root and keep their extension, so a.png and a.jpg,
+    # or x/a.png and y/a.png, never share an output file.
+    jobs, seen = [], {}
+    for path in paths:
+        name = os.path.relpath(path, root).replace(os.sep, "/")
+        out = os.path.join(out_dir, *f"{name}.{fmt}".split("/"))
+        key = os.path.normcase(os.path.abspath(out))
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be written to {out}")
+        seen[key] = path
+        jobs.append((path, out, name))
+    return jobs
+
+
+def job_seed(seed, name):
+    # Derived from the image's path relative to the input root rather than
+    # submission order, so a rerun (or a different worker count) renders every
+    # image identically
+    return [seed, zlib.crc32(name.encode())]
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def batch_command(args):
+    paths = find_images(args.input)
+    if not paths:
+        sys.exit(f"Error: no images match {args.input}")
+    try:
+        jobs = batch_jobs(paths, input_root(args.input), args.out_dir, args.format)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    for path, out, name in jobs:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    options = render_options(args)
+    workers = args.workers or available_cores()
+    # Bounded in-flight work keeps memory flat however many images there are
+    max_pending = workers * 2
+    print(f"Rendering {len(paths)} images on {workers} worker processes")
+
+    start = time.perf_counter()
+    done = failed = 0
+    # Workers load the same style plugins as this process
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=load_style_plugins,
+                                                initargs=(args.plugin,)) as pool:
+        pending = {}
+        remaining = iter(jobs)
+        while True:
+            for path, out, name in remaining:
+                future = pool.submit(render_file, path, out, args.frames, options,
+                                     job_seed(args.seed, name))
+                pending[future] = path
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                path = pending.pop(future)
+                try:
+                    elapsed = future.result()
+                except (OSError, ValueError, RuntimeError) as e:
+                    failed += 1
+                    print(f"FAILED {path}: {e}")
+                else:
+                    done += 1
+                    print(f"[{done + failed}/{len(paths)}] {path} "
+                          f"({args.frames / elapsed:.1f} frames/s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"{done} images ({done * args.frames} frames) in {elapsed:.2f}s "
+          f"({done * args.frames / elapsed:.1f} frames/s), {failed} failed")
+    return 1 if failed else 0
+
+
+# ==================== BENCHMARK ====================
+
+def synthetic_image(w, h, seed=0):
+    # Smooth gradients plus noise, so styles and quantization see varied colours.
+    # Built one float32 channel at a time to keep large sizes cheap.
+    rng = np.random.default_rng(seed)
+    xs = np.arange(w, dtype=np.float32)
+    ys = np.arange(h, dtype=np.float32)[:, None]
+    bases = (xs * (255 / max(1, w - 1)), ys * (255 / max(1, h - 1)),
+             (xs + ys) * (255 / max(1, w + h - 2)))
+    pixels = np.empty((h, w, 3), dtype=np.uint8)
+    for channel, base in enumerate(bases):
+        noisy = base + rng.integers(-24, 25, size=(h, w), dtype=np.int8)
+        pixels[:, :, channel] = np.clip(noisy, 0, 255)
+    return Image.fromarray(pixels)
+
+
+@functools.lru_cache(maxsize=1)
+def synthetic_source(w, h, seed=0):
+    # The synthetic image saved as a JPEG, so setup decodes and resizes a file
+    # like prepare_pixels does. Cached, as every case of a size opens the same
+    # file; removed at exit.
+    fd, path = tempfile.mkstemp(prefix="spike-bench-", suffix=".jpg")
+    os.close(fd)
+    atexit.register(os.remove, path)
+    synthetic_image(w, h, seed).save(path, quality=90)
+    return path
+
+
+def benchmark_run(source, grid_size, style, spike_type, spike_count, ticks, pixel_size, seed,
+                  cores):
+    # Returns the setup time and the time of each of the given number of ticks
+    gw, gh = grid_size
+    rng = np.random.default_rng(seed)
+    engine = None
+    try:
+        # Headless equivalent of prepare_pixels: decode and resize the file,
+        # build the engine (starting its workers) and the first displayed frame
+        start = time.perf_counter()
+        engine = make_engine(load_grid(source, grid_size), pixel_size, rng, cores)
+        engine.source_frame()
+        spikes = SpikeStore(rng)
+        if spike_type:
+            spikes.create_spikes(spike_type, spike_count, gw, gh, 0.5, 50)
+        setup = time.perf_counter() - start
+
+        # Steady-state ticks: spike update, full-frame render and compositing
+        latencies = []
+        for n in range(ticks):
+            start = time.perf_counter()
+            t = n / 30
+            spikes.update(gw, gh, t)
+            snapshot = SpikeFrame(spikes)
+            colors, xs, ys = engine.render(t, style, snapshot)
+            engine.compose(colors, xs, ys)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        if engine is not None:
+            engine.close()
+    return setup, latencies
+
+
+def benchmark_case(grid_size, style, spike_type, spike_count, frames, pixel_size, seed=0, cores=1):
+    gw, gh = grid_size
+    source = synthetic_source(gw * pixel_size, gh * pixel_size, seed)
+    case = (source, grid_size, style, spike_type, spike_count)
+
+    # Timed with allocation tracing off, as tracing slows rendering severalfold;
+    # the first two ticks are warm-up
+    setup, latencies = benchmark_run(*case, frames + 2, pixel_size, seed, cores)
+    latencies = np.array(latencies[2:])
+
+    # Peak memory from a separate, shorter traced run
+    tracemalloc.start()
+    try:
+        benchmark_run(*case, 3, pixel_size, seed, cores)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "grid": f"{gw}x{gh}",
+        "pixels": gw * gh,
+        "style": style,
+        "spikes": spike_type or "none",
+        "spike_count": spike_count if spike_type else 0,
+        "cores": cores,
+        "frames": frames,
+        "setup_ms": round(setup * 1000, 3),
+        "frame_ms_mean": round(float(latencies.mean()) * 1000, 3),
+        "frame_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "frame_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "frame_ms_max": round(float(latencies.max()) * 1000, 3),
+        "pixels_per_second": round(gw * gh * len(latencies) / float(latencies.sum())),
+        "peak_memory_mb": round(peak / 2**20, 2),
+    }
+
+
+def benchmark_cases(sizes, spike_counts):
+    # Each style without spikes, then each spike type and count with no style
+    for size in sizes:
+        for style in STYLE_NAMES:
+            yield size, style, None, 0
+        yield size, "Pixel Art + Cyberpunk", None, 0
+        for spike_type in SPIKE_TYPES:
+            for count in spike_counts:
+                if count:
+                    yield size, "Normal", spike_type, count
+
+
+def case_key(case):
+    return (case["grid"], case["style"], case["spikes"], case["spike_count"], case.get("cores", 1))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_command(args):
+    results = {
+        "label": args.label,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cores": available_cores(),
+        "pixel_size": args.pixel_size,
+        "peak_memory_note": "peak_memory_mb is traced in a separate run, in the benchmarking "
+                            "process only; with cores > 1 it excludes the worker processes "
+                            "and shared memory",
+        "cases": [],
+    }
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {case_key(case): case for case in json.load(f)["cases"]}
+
+    print(f"{'grid':>10} {'style':>10} {'spikes':>9} {'count':>6} {'cores':>5} {'setup ms':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'Mpix/s':>8} {'peak MB':>8}")
+    for size, style, spike_type, count in benchmark_cases(args.sizes, args.spike_counts):
+        for cores in args.cores:
+            case = benchmark_case(size, style, spike_type, count, args.frames, args.pixel_size,
+                                  args.seed, cores)
+            results["cases"].append(case)
+            print_case(case, baseline)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.out}")
+
+
+def print_case(case, baseline):
+    line = (f"{case['grid']:>10} {case['style']:>10} {case['spikes']:>9} {case['spike_count']:>6} "
+            f"{case['cores']:>5} {case['setup_ms']:>9.1f} {case['frame_ms_p50']:>8.2f} "
+            f"{case['frame_ms_p95']:>8.2f} {case['pixels_per_second'] / 1e6:>8.2f} "
+            f"{case['peak_memory_mb']:>8.1f}")
+    old = baseline.get(case_key(case))
+    if old:
+        line += f"  x{case['pixels_per_second'] / old['pixels_per_second']:.2f} vs baseline"
+    print(line, flush=True)
+
+
+def parse_list(convert):
+    def parse(value):
+        try:
+            return [convert(part) for part in value.split(",") if part]
+        except (ValueError, argparse.ArgumentTypeError):
+            raise argparse.ArgumentTypeError(f"invalid list: {value!r}")
+    return parse
+
+
+def add_render_options(parser):
+    parser.add_argument("--style", default="Normal",
+                        help="style or chain of styles, e.g. 'Pixel Art + Cyberpunk'")
+    parser.add_argument("--spikes", choices=SPIKE_TYPES, help="spike animation type")
+    parser.add_argument("--spike-count", type=positive(int), default=6)
+    parser.add_argument("--intensity", type=float, default=0.5)
+    parser.add_argument("--radius", type=float, default=50)
+    parser.add_argument("--frames", type=positive(int), default=300)
+    parser.add_argument("--fps", type=positive(float), default=30)
+    parser.add_argument("--size", type=parse_canvas_size, default=(800, 600),
+                        help="canvas size the image is fitted to (default 800x600)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantum Spike Art")
+    parser.add_argument("--plugin", action="append", default=[], metavar="FILE",
+                        help="Python file defining STYLES = {name: kernel}; repeatable")
+    commands = parser.add_subparsers(dest="command")
+
+    render = commands.add_parser("render", help="render an animation without a display")
+    render.add_argument("--input", required=True, help="source image")
+    render.add_argument("--out", required=True, help="output .gif, .mp4 or .png (sequence)")
+    render.add_argument("--seed", type=int, help="random seed for reproducible output")
+    render.add_argument("--profile", help="write per-frame stage timings to a .json or .csv file")
+    render.add_argument("--cores", type=positive(int), default=1, help="processes rendering tiles of each frame")
+    add_render_options(render)
+
+    batch = commands.add_parser("batch", help="render a folder of images on a process pool")
+    batch.add_argument("--input", required=True, help="directory or glob of source images")
+    batch.add_argument("--out-dir", required=True)
+    batch.add_argument("--format", default="gif", choices=["gif", "mp4", "png"])
+    batch.add_argument("--workers", type=positive(int), help="worker processes (default: available cores)")
+    batch.add_argument("--seed", type=int, default=0, help="base seed, combined with each file's path under the input root")
+    add_render_options(batch)
+
+    replay = commands.add_parser("replay", help="re-run a recorded session at full speed")
+    replay.add_argument("session", help="session file recorded by the app (.jsonl.gz)")
+    replay.add_argument("--input", help="source image, if it has moved since recording")
+    replay.add_argument("--out", help="also write the frames to a .gif, .mp4 or .png (sequence)")
+    replay.add_argument("--fps", type=positive(float), default=30, help="frame rate of --out")
+    replay.add_argument("--profile", help="write per-frame stage timings to a .json or .csv file")
+    replay.add_argument("--cores", type=positive(int), default=1, help="processes rendering tiles of each frame")
+
+    bench = commands.add_parser("bench", help="benchmark the headless render pipeline")
+    bench.add_argument("--sizes", type=parse_list(parse_size),
+                       default=[(100, 75), (400, 300), (1280, 720), (3840, 2160)],
+                       help="comma-separated pixel grid sizes after resize")
+    bench.add_argument("--spike-counts", type=parse_list(int), default=[0, 10, 100, 1000])
+    bench.add_argument("--frames", type=positive(int), default=10, help="timed frames per case")
+    bench.add_argument("--pixel-size", type=positive(int), default=2)
+    bench.add_argument("--cores", type=parse_list(positive(int)), default=[1],
+                       help="comma-separated process counts to run every case with, e.g. 1,2,4")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--label", help="free-form tag stored with the results")
+    bench.add_argument("--out", default="bench_results.json")
+    bench.add_argument("--compare", help="earlier results file to compare pixels/s against")
+
+    args = parser.parse_args(argv)
+    try:
+        load_style_plugins(args.plugin)
+        style_chain(getattr(args, "style", "Normal"))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.command == "render":
+        return render_command(args)
+    if args.command == "batch":
+        return batch_command(args)
+    if args.command == "bench":
+        return bench_command(args)
+    if args.command == "replay":
+        return replay_command(args)
+
+    if tk is None:
+        parser.error("Tkinter is not available; use the render command")
     root = tk.Tk()
     app = QuantumSpikeAnimator(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file